@@ -0,0 +1,94 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+
+import datetime
+import gc
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from goocalendar import ColumnarEventStore, EventStore, SQLiteEventStore, util
+from goocalendar.testing import (
+    START, benchmark, generate_events, print_benchmark)
+
+
+def bench_get_events(sizes=(10000, 50000, 100000, 200000, 400000)):
+    "Time a one week range query while the store grows in history."
+    print("get_events over one week (ms per query)")
+    print("%10s %12s %12s" % ("events", "indexed", "scan"))
+    start = START + datetime.timedelta(days=100)
+    end = start + datetime.timedelta(days=7)
+    for size in sizes:
+        event_store = EventStore()
+        event_store.add_events(list(generate_events(size)))
+        events = list(event_store.get_events())
+        number = 200
+        indexed = timeit.timeit(
+            lambda: event_store.get_events(start, end), number=number)
+        scan = timeit.timeit(
+            lambda: util.get_intersection_list(events, start, end), number=5)
+        print("%10d %12.3f %12.3f" % (
+                size, indexed / number * 1000, scan / 5 * 1000))
+
+
+def bench_memory(size=100000):
+    "Measure the memory used by each event created."
+    colors = ['lightgreen', 'lightblue', 'lightgrey', 'yellow']
+    gc.collect()
+    tracemalloc.start()
+    events = []
+    for i, event in enumerate(generate_events(size)):
+        # Colors usually come from a record so they are distinct strings
+        event.bg_color = ''.join(colors[i % len(colors)])
+        events.append(event)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("Memory: %d bytes per event" % (current / size))
+
+
+def bench_stores(sizes=(10000, 100000)):
+    "Compare the workloads of the event store backends."
+    factories = {
+        'EventStore': EventStore,
+        'SQLiteEventStore': SQLiteEventStore,
+        }
+    try:
+        ColumnarEventStore(capacity=1)
+    except ImportError:
+        pass
+    else:
+        factories['ColumnarEventStore'] = ColumnarEventStore
+    print("Event store backends (ms)")
+    print_benchmark(benchmark(factories, sizes))
+
+
+def bench_export(size=1000000):
+    "Measure the throughput and the memory of the iCalendar export."
+    event_store = EventStore()
+    event_store.add_events(list(generate_events(size)))
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as file:
+        begin = time.perf_counter()
+        count = event_store.export_ics(file)
+        duration = time.perf_counter() - begin
+        written = file.tell()
+    print("Export: %d events in %.1f s, %d events/s, %.1f MB/s" % (
+            count, duration, count / duration, written / duration / 1e6))
+    # The events are written one by one so the memory does not depend on
+    # the size of the range
+    for days in [30, 365]:
+        with tempfile.TemporaryFile('w', encoding='utf-8') as file:
+            tracemalloc.start()
+            count = event_store.export_ics(
+                file, START, START + datetime.timedelta(days=days))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        print("Export of %d days: %d events, peak %.0f kB allocated" % (
+                days, count, peak / 1e3))
+
+
+if __name__ == '__main__':
+    bench_get_events()
+    bench_memory()
+    bench_stores()
+    bench_export()
@@ -6,7 +6,16 @@ gi.require_version('Gtk', '3.0')
 gi.require_version('Gdk', '3.0')
 gi.require_version('PangoCairo', '1.0')
 from ._calendar import Calendar  # noqa: E402
-from ._event import Event, EventStore  # noqa: E402
+from ._columnar import ColumnarEventStore  # noqa: E402
+from ._composite import CompositeEventStore  # noqa: E402
+from ._event import Event, EventStore, RecurringEvent  # noqa: E402
+from ._lazy import AsyncEventStore, LazyEventStore  # noqa: E402
+from ._queue import EventQueue  # noqa: E402
+from ._snapshot import SnapshotEventStore  # noqa: E402
+from ._sqlite import SQLiteEventStore  # noqa: E402
 
-__all__ = ['Calendar', 'EventStore', 'Event']
+__all__ = ['Calendar', 'EventStore', 'Event', 'RecurringEvent',
+    'LazyEventStore', 'AsyncEventStore', 'SQLiteEventStore',
+    'ColumnarEventStore', 'SnapshotEventStore', 'CompositeEventStore',
+    'EventQueue']
 __version__ = '0.8.1'
@@ -6,6 +6,7 @@ import datetime
 from gi.repository import Gdk, GObject, Gtk, Pango, PangoCairo
 
 from . import util
+from ._event import RecurringEvent
 
 
 class Calendar(Gtk.DrawingArea):
@@ -58,13 +59,14 @@ class Calendar(Gtk.DrawingArea):
         self._line_height = 0
         self._realized = False
         self._event_store = None
-        self._event_removed_sigid = None
-        self._event_added_sigid = None
-        self._events_cleared_sigid = None
+        self._subscription = None
+        self._store_handlers = []
         self.event_store = event_store
         self.firstweekday = firstweekday
         self._drag_start_date = None
         self._drag_date = None
+        self._drag_event = None
+        self._drag_origin = None
         self._drag_x = None
         self._drag_y = None
         self._drag_height = 0
@@ -74,6 +76,13 @@ class Calendar(Gtk.DrawingArea):
         self._day_width = 0
         self._day_height = 0
         self._event_items = []
+        self._events_key = None
+        # The minimal height of the layout with the events
+        self._events_min_height = None
+        self._highlight_tokens = []
+        self._highlighted = set()
+        self._timed_dates = []
+        self._timed_events = []
         self._tooltip_text = None
         self._tooltip_x = None
         self._tooltip_y = None
@@ -153,7 +162,7 @@ class Calendar(Gtk.DrawingArea):
         # This is slow: When the month was changed we need to update
         # the entire canvas.
         if old_day is None or page_changed:
-            self.update()
+            self._update()
             self.emit('day-selected', self.selected_date)
             self.emit('page-changed', self.selected_date)
             return
@@ -204,7 +213,7 @@ class Calendar(Gtk.DrawingArea):
             return
         assert level in self.AVAILABLE_VIEWS
         self.view = level
-        self.update()
+        self._update()
         self.emit('view-changed', self.view)
 
     @property
@@ -214,23 +223,36 @@ class Calendar(Gtk.DrawingArea):
     @event_store.setter
     def event_store(self, event_store):
         # Disconnect previous event store if any
-        if self._event_store:
-            self._event_store.disconnect(self._event_removed_sigid)
-            self._event_store.disconnect(self._event_added_sigid)
-            self._event_store.disconnect(self._events_cleared_sigid)
+        if self._subscription is not None:
+            self._subscription.cancel()
+            self._subscription = None
+        for handler in self._store_handlers:
+            self._event_store.disconnect(handler)
+        self._store_handlers = []
 
         # Set and connect new event_store
         self._event_store = event_store
+        if event_store is not None and hasattr(event_store, 'subscribe'):
+            # Only the changes of the visible page are notified once it is
+            # laid out
+            self._subscription = self._event_store.subscribe(
+                self.on_event_store_changed)
+        elif event_store is not None and hasattr(event_store, 'connect'):
+            # Without signals, the calendar is refreshed by update
+            for signal, handler in [
+                    ('event-added', self.on_event_store_event_added),
+                    ('event-removed', self.on_event_store_event_removed),
+                    ('events-cleared', self.on_event_store_events_cleared),
+                    ('events-changed', self.on_event_store_events_changed),
+                    ('event-changed', self.on_event_store_event_changed),
+                    ]:
+                try:
+                    self._store_handlers.append(
+                        event_store.connect(signal, handler))
+                except TypeError:
+                    # The store does not emit this signal
+                    continue
         self.update()
-        if not event_store:
-            return
-        self._event_removed_sigid = self._event_store.connect('event-removed',
-            self.on_event_store_event_removed)
-        self._event_added_sigid = self._event_store.connect('event-added',
-            self.on_event_store_event_added)
-        self._events_cleared_sigid = \
-            self._event_store.connect('events-cleared',
-            self.on_event_store_events_cleared)
 
     def on_realize(self, *args):
         self._realized = True
@@ -241,9 +263,15 @@ class Calendar(Gtk.DrawingArea):
         alloc = self.get_allocation()
         if not self._realized or alloc.width < 10 or alloc.height < 10:
             return
-        self.update()
+        self._update()
 
     def update(self):
+        "Prepare again the layout and all the events"
+        self._events_key = None
+        self._update()
+
+    def _update(self):
+        "Prepare again the layout and the events if they may have changed"
         if not self._realized:
             return
         min_size = (self.min_width, self.min_height)
@@ -263,7 +291,54 @@ class Calendar(Gtk.DrawingArea):
             self._prepare_week_layout(w, h)
         elif self.view == "day":
             self._prepare_day_layout(w, h)
-        self._prepare_events()
+        key = self._get_events_key()
+        if key != self._events_key:
+            self._prepare_events()
+            self._update_highlighted()
+            self._events_key = self._get_events_key()
+            self._events_min_height = self.min_height
+        else:
+            # The layout reset the height needed by the events
+            self.min_height = self._events_min_height
+
+    def highlight(self, text):
+        """
+        Highlight the events of the page whose caption has, for each word of
+        text, a word starting with it.
+        """
+        self._highlight_tokens = util.tokenize(text or '')
+        self._update_highlighted()
+        self.queue_draw()
+
+    def _update_highlighted(self):
+        "Match only the events laid out on the page"
+        tokens = self._highlight_tokens
+        self._highlighted = {id(i.event) for i in self._event_items
+            if tokens and util.match_tokens(i.event.caption, tokens)}
+
+    def _get_events_key(self):
+        """
+        Returns the values on which the layout of the events depends: the
+        version of the store, the page and the allocation.
+        """
+        if self.view == "month":
+            page = (self.selected_date.year, self.selected_date.month)
+        elif self.view == "week":
+            cal = calendar.Calendar(self.firstweekday)
+            page = (self.selected_date.year, self.selected_date.month,
+                util.first_day_of_week(cal, self.selected_date))
+        else:
+            page = self.selected_date
+        store = self._event_store
+        if store is None:
+            version = None
+        else:
+            # Without version, the events may always have changed
+            version = getattr(store, 'version', object())
+        alloc = self.get_allocation()
+        return (id(store), version, self.view,
+            self.firstweekday, page, alloc.width, alloc.height,
+            self.font_size)
 
     def _prepare_day_layout(self, w, h):
         """
@@ -470,6 +545,8 @@ class Calendar(Gtk.DrawingArea):
 
         # Clear previous events.
         self._event_items = []
+        self._timed_dates = []
+        self._timed_events = []
         for day in self.days:
             day.lines.clear()
             day.show_indic = False
@@ -477,7 +554,7 @@ class Calendar(Gtk.DrawingArea):
             if day.visible:
                 day.compute_line_height(self)
 
-        if not self._event_store:
+        if self._event_store is None:
             return
 
         cal = calendar.Calendar(self.firstweekday)
@@ -498,6 +575,8 @@ class Calendar(Gtk.DrawingArea):
         start = datetime.datetime.combine(dates[0], datetime.time())
         end = datetime.datetime.combine(dates[-1], datetime.time()) \
             + onedaydelta
+        if self._subscription is not None:
+            self._subscription.set_range(start, end)
         events = self._event_store.get_events(start, end)
         events.sort(key=util.event_days, reverse=True)
 
@@ -594,8 +673,7 @@ class Calendar(Gtk.DrawingArea):
             return
 
         # Prepare the timeline.
-        alloc = self.get_allocation()
-        w, h = alloc.width, alloc.height
+        h = self.get_allocation().height
         max_y += (h - max_y) % 24
         self._timeline.x = 0
         self._timeline.y = max_y
@@ -611,72 +689,123 @@ class Calendar(Gtk.DrawingArea):
         self.min_height = int(max_y + 24 * min_line_height)
 
         # Prepare non-all-day events.
+        self._timed_dates = dates
+        self._timed_events = non_all_day_events
         for date in dates:
-            date_start = datetime.datetime.combine(date, datetime.time())
-            date_end = (datetime.datetime.combine(date_start, datetime.time())
-                + datetime.timedelta(days=1))
-            day = self._get_day_item(date)
-            day_events = util.get_intersection_list(non_all_day_events,
-                date_start, date_end)
-            day_events.sort()
-            columns = []
-
-            remaining_events = day_events[:]
-            while len(remaining_events) > 0:
-                columns.append([remaining_events[0]])
-                for event in remaining_events[1:]:
-                    intersections = util.count_intersections(columns[-1],
-                        event.start, event.end)
-                    if intersections == 0:
-                        columns[-1].append(event)
-                for event in columns[-1]:
-                    remaining_events.remove(event)
-
-            for columnno, column in enumerate(columns):
-                for event in column:
-                    event1_start = max(event.start, date_start)
-                    event1_end = min(event.end, date_end)
-
-                    parallel = util.count_parallel_events(day_events,
-                        event1_start, event1_end)
-
-                    top_offset = event1_start - date_start
-                    bottom_offset = event1_end - event1_start
-                    top_offset_mins = top_offset.seconds / 60
-                    bottom_offset_mins = ((bottom_offset.days * 24 * 60)
-                        + bottom_offset.seconds / 60)
-
-                    event_item = EventItem(self, event=event,
-                        time_format=self.time_format)
-                    if event.event_items:
-                        event_item.no_caption = True
-                    event.event_items.append(event_item)
-                    self._event_items.append(event_item)
-                    y_off1 = top_offset_mins * self.minute_height
-                    y_off2 = bottom_offset_mins * self.minute_height
-                    if self.view == "day":
-                        x_start = self._timeline.get_width(self)
-                        column_width = (
-                            (w - self._timeline.get_width(self)) / parallel)
-                    else:
-                        column_width = day.width / parallel
-                        x_start = day.x
-                    event_item.left_border = x_start + 2
-                    event_item.x = x_start + (columnno * column_width) + 2
-                    event_item.y = max_y + y_off1
-                    event_item.width = column_width - 4
-                    if columnno != (parallel - 1):
-                        event_item.width += column_width / 1.2
-                    event_item.height = max(
-                        event_item.get_line_height(self), y_off2)
-                    if event.start < event1_start and event.end > event1_end:
-                        event_item.type = 'mid'
-                    elif event.start < event1_start:
-                        event_item.type = 'top'
-                    elif event.end > event1_end:
-                        event_item.type = 'bottom'
-                    else:
-                        event_item.type = 'topbottom'
+            self._prepare_timed_events(date)
+
+    def _prepare_timed_events(self, date):
+        """
+        Prepares the non-all-day events of the given date in week and day
+        views.
+        """
+        w = self.get_allocation().width
+        max_y = self._timeline.y
+        date_start = datetime.datetime.combine(date, datetime.time())
+        date_end = (datetime.datetime.combine(date_start, datetime.time())
+            + datetime.timedelta(days=1))
+        day = self._get_day_item(date)
+        # The intersections are tested on the datetime_key of the events
+        date_start_key, date_end_key = util.range_keys(date_start, date_end)
+        day_events = util.get_intersection_list(self._timed_events,
+            date_start, date_end)
+        day_events.sort(key=util.event_keys)
+        day_keys = [util.event_keys(e) for e in day_events]
+        columns = []
+
+        remaining = list(zip(day_events, day_keys))
+        while len(remaining) > 0:
+            columns.append([remaining[0]])
+            for event, (start, end) in remaining[1:]:
+                if not any(util.keys_intersect(*keys, start, end)
+                        for _, keys in columns[-1]):
+                    columns[-1].append((event, (start, end)))
+            column = {id(e) for e, _ in columns[-1]}
+            remaining = [r for r in remaining if id(r[0]) not in column]
+
+        for columnno, column in enumerate(columns):
+            for event, (start, end) in column:
+                event1_start = max(start, date_start_key)
+                event1_end = min(end, date_end_key)
+
+                parallel = util.count_parallel_keys(day_keys,
+                    event1_start, event1_end)
+
+                # The offsets are in minutes without the microseconds
+                top_offset_mins = (
+                    (event1_start - date_start_key) // 1000000 / 60)
+                bottom_offset_mins = (
+                    (event1_end - event1_start) // 1000000 / 60)
+
+                event_item = EventItem(self, event=event, date=date,
+                    time_format=self.time_format)
+                # Only the first visible day of the event shows the caption
+                if start < date_start_key and date != self._timed_dates[0]:
+                    event_item.no_caption = True
+                event.event_items.append(event_item)
+                self._event_items.append(event_item)
+                y_off1 = top_offset_mins * self.minute_height
+                y_off2 = bottom_offset_mins * self.minute_height
+                if self.view == "day":
+                    x_start = self._timeline.get_width(self)
+                    column_width = (
+                        (w - self._timeline.get_width(self)) / parallel)
+                else:
+                    column_width = day.width / parallel
+                    x_start = day.x
+                event_item.left_border = x_start + 2
+                event_item.x = x_start + (columnno * column_width) + 2
+                event_item.y = max_y + y_off1
+                event_item.width = column_width - 4
+                if columnno != (parallel - 1):
+                    event_item.width += column_width / 1.2
+                event_item.height = max(
+                    event_item.get_line_height(self), y_off2)
+                if start < event1_start and end > event1_end:
+                    event_item.type = 'mid'
+                elif start < event1_start:
+                    event_item.type = 'top'
+                elif end > event1_end:
+                    event_item.type = 'bottom'
+                else:
+                    event_item.type = 'topbottom'
+
+    def _update_timed_events(self, event, old, new):
+        """
+        Prepares again the non-all-day events of the days touched by the old
+        or the new interval of the changed event.
+        """
+        changed_dates = set()
+        for start, end in [old, new]:
+            date = start.date()
+            while date <= end.date():
+                changed_dates.add(date)
+                date += datetime.timedelta(days=1)
+        dates = [d for d in self._timed_dates if d in changed_dates]
+        if not dates:
+            return
+
+        events = [e for e in self._timed_events if e is not event]
+        page_start = datetime.datetime.combine(
+            self._timed_dates[0], datetime.time())
+        page_end = datetime.datetime.combine(
+            self._timed_dates[-1], datetime.time()) + datetime.timedelta(1)
+        if util.event_intersects(event, page_start, page_end):
+            events.append(event)
+        self._timed_events = events
+
+        for event_item in self._event_items[:]:
+            if event_item.date in dates:
+                self._event_items.remove(event_item)
+                if event_item in event_item.event.event_items:
+                    event_item.event.event_items.remove(event_item)
+        event.event_items = []
+        for date in dates:
+            self._prepare_timed_events(date)
+        if self._events_key is not None:
+            self._events_key = self._get_events_key()
+        self._update_highlighted()
+        self.queue_draw()
 
     def on_draw(self, widget, cr):
         """Handle the draw signal - draw the entire calendar."""
@@ -703,14 +832,33 @@ class Calendar(Gtk.DrawingArea):
 
         return False
 
-    def on_event_store_event_removed(self, store, event):
-        self.update()
+    def on_event_store_event_added(self, store, events):
+        self._update()
 
-    def on_event_store_event_added(self, store, event):
-        self.update()
+    def on_event_store_event_removed(self, store, event):
+        self._update()
 
     def on_event_store_events_cleared(self, store):
-        self.update()
+        self._update()
+
+    def on_event_store_events_changed(self, store, added, removed, changed):
+        self._update()
+
+    def on_event_store_event_changed(self, store, event, old, new):
+        self.on_event_store_changed([], [], [(event, old, new)])
+
+    def on_event_store_changed(self, added, removed, changed):
+        def timed(start, end):
+            return end is not None and (end - start).days == 0
+        if (not added and not removed and len(changed) == 1
+                and self._realized and self.view in {"week", "day"}
+                and self._timed_dates):
+            event, old, new = changed[0]
+            if (not isinstance(event, RecurringEvent) and not event.all_day
+                    and timed(*old) and timed(*new)):
+                self._update_timed_events(event, old, new)
+                return
+        self._update()
 
     def on_key_press_event(self, widget, event):
         date = self.selected_date
@@ -750,12 +898,10 @@ class Calendar(Gtk.DrawingArea):
                 if self._drag_x is not None:
                     event_item.transparent = False
                     self._stop_drag_and_drop()
-                    self.update()
                     self.emit('event-released', event_item.event)
                     return True
         if self._drag_x is not None:
             self._stop_drag_and_drop()
-            self.update()
         return False
 
     def on_motion_notify_event(self, widget, event):
@@ -839,6 +985,8 @@ class Calendar(Gtk.DrawingArea):
 
     def _handle_event_item_press(self, event_item, event):
         if event_item.event.editable:
+            self._drag_event = event_item.event
+            self._drag_origin = (event_item.event.start, event_item.event.end)
             self._drag_x = event.x
             self._drag_y = event.y
             self._drag_height = 0
@@ -928,6 +1076,28 @@ class Calendar(Gtk.DrawingArea):
         self._drag_date = None
         self.set_has_tooltip(True)
 
+        # Commit the dragged interval through the store
+        event, self._drag_event = self._drag_event, None
+        if event is None:
+            return
+        start, end = event.start, event.end
+        origin, self._drag_origin = self._drag_origin, None
+        if (start, end) == origin:
+            # A click does not change the event but its item may have moved
+            self.update()
+            return
+        event.start, event.end = origin
+        store = self._event_store
+        if not hasattr(store, 'update_event'):
+            event.start, event.end = start, end
+            self.update()
+        elif (event in store if hasattr(store, '__contains__')
+                else event.id is not None):
+            store.update_event(event, start=start, end=end)
+        else:
+            # The store removed the event during the drag
+            self.update()
+
     def _handle_event_item_motion(self, event_item, event):
         diff_y = event.y - self._drag_y
         self._drag_x = event.x
@@ -1201,6 +1371,7 @@ class EventItem:
         self.bg_color = kwargs.get('bg_color')
         self.text_color = kwargs.get('text_color', 'black')
         self.event = kwargs.get('event')
+        self.date = kwargs.get('date')
         self.type = kwargs.get('type', 'leftright')
         self.time_format = kwargs.get('time_format')
         self.transparent = False
@@ -1259,6 +1430,15 @@ class EventItem:
         else:
             self._draw_event(cr, cal)
 
+    def _draw_highlight(self, cr, cal):
+        if id(self.event) not in cal._highlighted:
+            return
+        r, g, b, a = parse_color(cal.props.selected_border_color)
+        cr.set_source_rgba(r, g, b, a)
+        cr.set_line_width(2)
+        cr.rectangle(self.x + 1, self.y + 1, self.width - 2, self.height - 2)
+        cr.stroke()
+
     def _draw_event(self, cr, cal):
         self.width = max(self.width, 0)
         starttime = self.event.start.strftime(self.time_format)
@@ -1306,6 +1486,7 @@ class EventItem:
             cr.set_source_rgba(r, g, b, a)
             cr.rectangle(self.x, self.y, self.width, self.height)
             cr.fill()
+        self._draw_highlight(cr, cal)
 
         # Draw the text
         r, g, b, a = parse_color(the_event_text_color)
@@ -1356,6 +1537,7 @@ class EventItem:
             cr.set_source_rgba(r, g, b, a)
             cr.rectangle(self.x, self.y, self.width, self.height)
             cr.fill()
+        self._draw_highlight(cr, cal)
 
         # Draw the text
         r, g, b, a = parse_color(the_event_text_color)
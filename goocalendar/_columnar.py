@@ -0,0 +1,276 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import collections.abc
+import datetime
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import util
+from ._event import Event, EventSnapshot, EventStore, get_style
+
+ALL_DAY = 1
+EDITABLE = 2
+HAS_END = 4
+START_DATE = 8
+END_DATE = 16
+# The aware datetimes are stored in UTC
+START_UTC = 32
+END_UTC = 64
+
+
+def is_aware(value):
+    return (isinstance(value, datetime.datetime)
+        and value.utcoffset() is not None)
+
+
+def to_datetime64(value):
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    elif value.utcoffset() is not None:
+        value = value.astimezone(datetime.timezone.utc)
+    return numpy.datetime64(value.replace(tzinfo=None), 'us')
+
+
+class EventRows(collections.abc.Sequence):
+    "A sequence of the events of some rows created when accessed"
+
+    def __init__(self, store, rows):
+        self._store = store
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return EventRows(self._store, self._rows[i])
+        return self._store._get_event(int(self._rows[i]))
+
+    def intersecting(self, start, end=None):
+        "Return the rows which intersect the range like interval_intersects"
+        store = self._store
+        start = to_datetime64(start)
+        end = to_datetime64(end) if end else start
+        starts, ends = store._starts[self._rows], store._ends[self._rows]
+        mask = (((starts >= start) & (starts < end))
+            | ((ends > start) & (ends <= end))
+            | ((starts < start) & (ends > end))
+            | ((starts == start) & (ends == end)))
+        return EventRows(store, self._rows[mask])
+
+
+class ColumnarEventStore(EventStore):
+    """
+    This class is an event store which keeps the events in NumPy arrays and
+    creates Event objects only for the events returned by queries.
+    """
+
+    def __init__(self, capacity=1024):
+        if numpy is None:
+            raise ImportError("ColumnarEventStore requires numpy")
+        super(ColumnarEventStore, self).__init__()
+        self._events = weakref.WeakValueDictionary()
+        self._size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self._starts = numpy.empty(capacity, dtype='datetime64[us]')
+        self._ends = numpy.empty(capacity, dtype='datetime64[us]')
+        self._flags = numpy.zeros(capacity, dtype=numpy.uint8)
+        self._style_ids = numpy.zeros(capacity, dtype=numpy.int32)
+        self._alive = numpy.zeros(capacity, dtype=bool)
+        self._captions = [None] * capacity
+        # The rows of the removed events are reused
+        self._free = []
+        self._styles = []
+        self._style_ids_map = {}
+
+    def _grow(self, size):
+        capacity = len(self._starts)
+        if size <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        extra = capacity - len(self._starts)
+        for name in ['_starts', '_ends', '_flags', '_style_ids', '_alive']:
+            array = getattr(self, name)
+            array = numpy.concatenate(
+                [array, numpy.zeros(extra, dtype=array.dtype)])
+            setattr(self, name, array)
+        self._captions.extend([None] * extra)
+
+    def _style_id(self, style):
+        style = get_style(*style)
+        if style not in self._style_ids_map:
+            self._style_ids_map[style] = len(self._styles)
+            self._styles.append(style)
+        return self._style_ids_map[style]
+
+    def _write(self, row, event):
+        "Write the event in the columns of the row"
+        flags = HAS_END if event.end is not None else 0
+        if event.all_day:
+            flags |= ALL_DAY
+        if event.editable:
+            flags |= EDITABLE
+        if not isinstance(event.start, datetime.datetime):
+            flags |= START_DATE
+        if (event.end is not None
+                and not isinstance(event.end, datetime.datetime)):
+            flags |= END_DATE
+        if is_aware(event.start):
+            flags |= START_UTC
+        if is_aware(event.end):
+            flags |= END_UTC
+        end = event.end if event.end is not None else event.start
+        self._starts[row] = to_datetime64(event.start)
+        self._ends[row] = max(to_datetime64(end), self._starts[row])
+        self._flags[row] = flags
+        self._style_ids[row] = self._style_id(
+            (event.text_color, event.bg_color))
+        self._captions[row] = event.caption
+
+    def _get_event(self, row):
+        "Return the event of the row reusing the one in memory if any"
+        event = self._events.get(row)
+        if event is None:
+            flags = int(self._flags[row])
+            start = self._starts[row].astype(datetime.datetime)
+            if flags & START_DATE:
+                start = start.date()
+            elif flags & START_UTC:
+                start = start.replace(tzinfo=datetime.timezone.utc)
+            end = None
+            if flags & HAS_END:
+                end = self._ends[row].astype(datetime.datetime)
+                if flags & END_DATE:
+                    end = end.date()
+                elif flags & END_UTC:
+                    end = end.replace(tzinfo=datetime.timezone.utc)
+            text_color, bg_color = self._styles[self._style_ids[row]]
+            event = Event(self._captions[row], start, end,
+                all_day=bool(flags & ALL_DAY),
+                editable=bool(flags & EDITABLE),
+                text_color=text_color, bg_color=bg_color)
+            event.id = row
+            event._store = self
+            self._events[row] = event
+        return event
+
+    def _lookup(self, id_):
+        if id_ < 0:
+            return self._recurring[id_]
+        return self._get_event(id_)
+
+    def _insert(self, event):
+        assert event.id is None
+        if self._free:
+            row = self._free.pop()
+        else:
+            self._grow(self._size + 1)
+            row = self._size
+            self._size += 1
+        self._write(row, event)
+        self._alive[row] = True
+        event.id = row
+        event._store = self
+        self._events[row] = event
+
+    def _insert_many(self, events):
+        for event in events:
+            self._insert(event)
+
+    def _delete(self, event):
+        self._alive[event.id] = False
+        self._captions[event.id] = None
+        self._free.append(event.id)
+        self._events.pop(event.id, None)
+        event._store = None
+
+    def _reindex(self, event):
+        self._write(event.id, event)
+
+    def _reset(self):
+        for event in self._events.values():
+            event._store = None
+        self._events.clear()
+        self._size = 0
+        self._allocate(len(self._starts))
+
+    def add_arrays(self, captions, starts, ends, text_colors=None,
+            bg_colors=None, all_day=None, editable=None):
+        """
+        Add events from parallel sequences without creating Event objects.
+        starts and ends are datetime64 arrays or sequences of datetime.
+        """
+        starts = numpy.asarray(starts, dtype='datetime64[us]')
+        ends = numpy.asarray(ends, dtype='datetime64[us]')
+        n = len(starts)
+        assert len(captions) == len(ends) == n
+        assert (starts <= ends).all()
+        reused = self._free[len(self._free) - min(n, len(self._free)):]
+        del self._free[len(self._free) - len(reused):]
+        added = n - len(reused)
+        rows = numpy.concatenate([numpy.array(reused, dtype=numpy.intp),
+                numpy.arange(self._size, self._size + added)])
+        self._grow(self._size + added)
+        self._starts[rows] = starts
+        self._ends[rows] = ends
+        flags = numpy.full(n, HAS_END | EDITABLE, dtype=numpy.uint8)
+        if all_day is not None:
+            flags |= numpy.where(all_day, ALL_DAY, 0).astype(numpy.uint8)
+        if editable is not None:
+            flags &= numpy.where(editable, 0xFF, ~EDITABLE & 0xFF).astype(
+                numpy.uint8)
+        self._flags[rows] = flags
+        if text_colors is None:
+            text_colors = [None] * n
+        if bg_colors is None:
+            bg_colors = ['orangered'] * n
+        self._style_ids[rows] = [self._style_id(style)
+            for style in zip(text_colors, bg_colors)]
+        for row, caption in zip(reused, captions):
+            self._captions[row] = caption
+        self._captions[self._size:self._size + added] = captions[len(reused):]
+        self._alive[rows] = True
+        self._size += added
+        self._notify_added(EventRows(self, rows))
+
+    def snapshot(self):
+        "Returns an EventSnapshot of copies of the events"
+        return EventSnapshot.from_events(self)
+
+    def _ordered(self, start, end):
+        size = self._size
+        # The unbounded keys are out of the range of datetime
+        start = util.key_datetime(max(start, util.DAY_KEY))
+        end = util.key_datetime(min(end, util.MAX_KEY - 1))
+        mask = ((self._starts[:size] <= to_datetime64(end))
+            & (self._ends[:size] >= to_datetime64(start))
+            & self._alive[:size])
+        rows = numpy.flatnonzero(mask)
+        order = numpy.lexsort((self._ends[rows], self._starts[rows]))
+        for row in rows[order]:
+            yield self._get_event(int(row))
+
+    def _query(self, start, end):
+        size = self._size
+        if not start and not end:
+            rows = numpy.flatnonzero(self._alive[:size])
+            return [self._get_event(int(row)) for row in rows]
+        end = end if end else start
+        mask = ((self._starts[:size] <= to_datetime64(end))
+            & (self._ends[:size] >= to_datetime64(start))
+            & self._alive[:size])
+        start, end = util.range_keys(start, end)
+        events = []
+        for row in numpy.flatnonzero(mask):
+            event = self._get_event(int(row))
+            if util.keys_intersect(*util.event_keys(event), start, end):
+                events.append(event)
+        return events
@@ -0,0 +1,238 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import functools
+import heapq
+
+from . import util
+from ._event import EventSnapshot, EventStore
+
+
+class Layer(object):
+
+    def __init__(self, store, visible):
+        self.store = store
+        self.visible = visible
+        self.handlers = []
+        self.subscription = None
+
+
+class CompositeEventStore(EventStore):
+    """
+    This class is an event store which merges the events of several stores
+    displayed as layers which can be hidden.
+    """
+
+    def __init__(self, stores=()):
+        super(CompositeEventStore, self).__init__()
+        self._layers = []
+        self._range = None
+        self._clearing = False
+        for store in stores:
+            self.add_layer(store)
+
+    @property
+    def version(self):
+        return self._version + sum(
+            layer.store.version for layer in self._layers)
+
+    @property
+    def layers(self):
+        return [layer.store for layer in self._layers]
+
+    def _get_layer(self, store):
+        for layer in self._layers:
+            if layer.store is store:
+                return layer
+        raise ValueError("%r is not a layer" % store)
+
+    def set_range(self, start, end):
+        """
+        Set the range of the events notified when a layer is shown or hidden
+        instead of the ranges of the subscriptions.
+        """
+        self._range = (start, end)
+
+    def _visible_events(self, layer):
+        "Return the events of the layer in the range or the subscriptions"
+        if self._range is not None:
+            ranges = [self._range]
+        else:
+            ranges = [(s.start, s.end) for s in self._subscriptions]
+        if any(not start and not end for start, end in ranges):
+            return layer.store.get_events()
+        events = {}
+        for start, end in ranges:
+            for event in layer.store.get_events(start, end):
+                events[id(event)] = event
+        return list(events.values())
+
+    def _notify(self, added, removed, changed=()):
+        if self._batch_level:
+            for event in added:
+                self._batch_added[id(event)] = event
+            for event in removed:
+                self._batch_changed.pop(id(event), None)
+                if self._batch_added.pop(id(event), None) is None:
+                    self._batch_removed[id(event)] = event
+            for event, old, _ in changed:
+                if id(event) not in self._batch_added:
+                    self._batch_changed.setdefault(id(event), (event, old))
+        elif added or removed or changed:
+            self.emit('events-changed', added, removed,
+                [e for e, _, _ in changed])
+            self._publish(added, removed, changed)
+
+    def add_layer(self, store, visible=True):
+        "Add the store as the top layer"
+        layer = Layer(store, visible)
+        for signal, handler in [
+                ('event-added', self._on_event_added),
+                ('event-removed', self._on_event_removed),
+                ('events-cleared', self._on_events_cleared),
+                ('events-changed', self._on_events_changed),
+                ('event-changed', self._on_event_changed),
+                ]:
+            layer.handlers.append(store.connect(
+                    signal, functools.partial(handler, layer)))
+        # The changes are collected from the subscription as it gives the
+        # old intervals
+        layer.subscription = store.subscribe(
+            functools.partial(self._on_layer_changed, layer))
+        self._layers.append(layer)
+        if visible:
+            self._notify(self._visible_events(layer), [])
+
+    def remove_layer(self, store):
+        layer = self._get_layer(store)
+        for handler in layer.handlers:
+            store.disconnect(handler)
+        layer.subscription.cancel()
+        self._layers.remove(layer)
+        # Keep the version increasing
+        self._version += store.version
+        self._changed()
+        if layer.visible:
+            self._notify([], self._visible_events(layer))
+
+    def is_visible(self, store):
+        return self._get_layer(store).visible
+
+    def set_visible(self, store, visible):
+        """
+        Show or hide the layer of the store. Only the events of the layer in
+        the range are emitted.
+        """
+        layer = self._get_layer(store)
+        if layer.visible == visible:
+            return
+        layer.visible = visible
+        self._changed()
+        events = self._visible_events(layer)
+        if visible:
+            self._notify(events, [])
+        else:
+            self._notify([], events)
+
+    def _on_layer_changed(self, layer, added, removed, changed):
+        if not layer.visible:
+            return
+        if self._batch_level:
+            self._notify(added, removed, changed)
+        else:
+            self._publish(added, removed, changed)
+
+    def _forward(self, layer, signal, *args):
+        # In a batch, the changes are collected by _on_layer_changed
+        if layer.visible and not self._batch_level:
+            self.emit(signal, *args)
+
+    def _on_event_added(self, layer, store, events):
+        self._forward(layer, 'event-added', events)
+
+    def _on_event_removed(self, layer, store, event):
+        self._forward(layer, 'event-removed', event)
+
+    def _on_events_cleared(self, layer, store):
+        if not self._clearing:
+            self._forward(layer, 'events-cleared')
+
+    def _on_events_changed(self, layer, store, added, removed, changed):
+        self._forward(layer, 'events-changed', added, removed, changed)
+
+    def _on_event_changed(self, layer, store, event, old, new):
+        self._forward(layer, 'event-changed', event, old, new)
+
+    def add_events(self, events):
+        "Add the events to the first layer"
+        self._layers[0].store.add_events(events)
+
+    def __contains__(self, event):
+        return any(event in layer.store for layer in self._layers)
+
+    def remove(self, event):
+        assert event is not None
+        if event._store is not None:
+            event._store.remove(event)
+
+    def update_event(self, event, **changes):
+        assert event is not None
+        if event._store is not None:
+            event._store.update_event(event, **changes)
+        else:
+            super(CompositeEventStore, self).update_event(event, **changes)
+
+    def apply_delta(self, upserts, deletions=()):
+        "Apply the changes to the first layer"
+        self._layers[0].store.apply_delta(upserts, deletions)
+
+    def clear(self):
+        "Remove all the events of all the layers"
+        if self._batch_level:
+            self._notify([], self.get_events())
+        self._clearing = True
+        try:
+            for layer in self._layers:
+                layer.store.clear()
+        finally:
+            self._clearing = False
+        if not self._batch_level:
+            self.emit('events-cleared')
+
+    def snapshot(self):
+        "Returns an EventSnapshot of copies of the visible events"
+        return EventSnapshot.from_events(self)
+
+    def search(self, text, start=None, end=None):
+        "Returns the events of the visible layers matching the text by date"
+        return list(heapq.merge(*(layer.store.search(text, start, end)
+                    for layer in self._layers if layer.visible),
+                key=util.event_keys))
+
+    def iter_events(self, start=None, end=None):
+        """
+        Returns a generator of the events of the visible layers which
+        intersect with the given start and end times sorted by time.
+        """
+        return heapq.merge(*(layer.store.iter_events(start, end)
+                for layer in self._layers if layer.visible),
+            key=util.event_keys)
+
+    def _day_indexes(self, first, last):
+        return [index for layer in self._layers if layer.visible
+            for index in layer.store._day_indexes(first, last)]
+
+    def add_attribute_index(self, name):
+        "Index the attribute in all the layers"
+        for layer in self._layers:
+            layer.store.add_attribute_index(name)
+
+    def get_events(self, start=None, end=None, where=None):
+        """
+        Returns the events of the visible layers that intersect with the given
+        start and end times.
+        """
+        events = []
+        for layer in self._layers:
+            if layer.visible:
+                events.extend(layer.store.get_events(start, end, where))
+        return events
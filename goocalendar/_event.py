@@ -1,8 +1,33 @@
 # This file is part of GooCalendar.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import collections
+import contextlib
+import datetime
+import functools
+import heapq
+import weakref
+
 from gi.repository import GObject
 
 from . import util
+from ._index import DayIndex, IntervalIndex, TokenIndex
+
+_styles = {}
+_missing = object()
+
+
+def get_style(text_color, bg_color):
+    "Return the shared style tuple for the colors"
+    style = (text_color, bg_color)
+    return _styles.setdefault(style, style)
+
+
+@functools.lru_cache()
+def _slots(cls):
+    "Return the names of the slots of the class which store values"
+    return tuple(name for c in cls.__mro__
+        for name in getattr(c, '__slots__', ())
+        if name not in {'__dict__', '__weakref__'})
 
 
 @util.total_ordering
@@ -10,6 +35,14 @@ class Event(object):
     """
     This class represents an event that can be displayed in the calendar.
     """
+    # __dict__ is only allocated for the events on which extra attributes
+    # are set
+    __slots__ = ('id', 'caption', 'editable', 'all_day', '_start', '_end',
+        '_keys', '_style', '_event_items', '_store', '__dict__',
+        '__weakref__')
+    # The attributes copied by EventStore.apply_delta
+    FIELDS = ('caption', 'start', 'end', 'all_day', 'editable', 'text_color',
+        'bg_color')
 
     def __init__(self, caption, start, end=None, **kwargs):
         assert caption is not None
@@ -17,22 +50,86 @@ class Event(object):
         if end is not None:
             assert start <= end
         self.id = None
+        self._store = None
         self.caption = caption
         self.start = start
         self.end = end
         self.editable = kwargs.get('editable', True)
         self.all_day = kwargs.get('all_day', False)
-        self.text_color = kwargs.get('text_color', None)
-        self.bg_color = kwargs.get('bg_color', 'orangered')
-        self.event_items = []
+        self._style = get_style(kwargs.get('text_color', None),
+            kwargs.get('bg_color', 'orangered'))
+        self._event_items = None
         if end is None:
             self.all_day = True
 
+    @property
+    def start(self):
+        return self._start
+
+    @start.setter
+    def start(self, value):
+        if self._store is not None:
+            self._store._preserve(self)
+        self._start = value
+        # The keys are computed again by util.event_keys
+        self._keys = None
+        if self._store is not None:
+            self._store._refresh(self)
+
+    @property
+    def end(self):
+        return self._end
+
+    @end.setter
+    def end(self, value):
+        if self._store is not None:
+            self._store._preserve(self)
+        self._end = value
+        self._keys = None
+        if self._store is not None:
+            self._store._refresh(self)
+
+    @property
+    def text_color(self):
+        return self._style[0]
+
+    @text_color.setter
+    def text_color(self, value):
+        self._style = get_style(value, self._style[1])
+
+    @property
+    def bg_color(self):
+        return self._style[1]
+
+    @bg_color.setter
+    def bg_color(self, value):
+        self._style = get_style(self._style[0], value)
+
+    @property
+    def event_items(self):
+        # The list is only created for the events which are displayed
+        if self._event_items is None:
+            self._event_items = []
+        return self._event_items
+
+    @event_items.setter
+    def event_items(self, value):
+        self._event_items = value
+
+    def _copy(self):
+        "Return a copy of the event which is not in a store"
+        event = object.__new__(type(self))
+        for name in _slots(type(self)):
+            if hasattr(self, name):
+                object.__setattr__(event, name, getattr(self, name))
+        event.__dict__.update(self.__dict__)
+        object.__setattr__(event, '_store', None)
+        object.__setattr__(event, '_event_items', None)
+        return event
+
     @property
     def multidays(self):
-        if not self.end:
-            return False
-        return (self.end - self.start).days > 0
+        return util.event_days(self) > 0
 
     def __eq__(self, other_event):
         if not isinstance(other_event, Event):
@@ -40,16 +137,247 @@ class Event(object):
         return (self.start, self.end) == (other_event.start, other_event.end)
 
     def __lt__(self, other_event):
-        def convert(event):
-            start = event.start
-            end = event.end if event.end is not None else event.start
-            return start, end
         if not isinstance(other_event, Event):
             return NotImplemented
-        return convert(self) < convert(other_event)
+        return util.event_keys(self) < util.event_keys(other_event)
+
+
+class RecurringEvent(Event):
+    """
+    This class represents an event which is repeated with a frequency.
+    It is stored once and expanded into occurrences for the requested range.
+    """
+    __slots__ = ('freq', 'interval', 'count', 'until', 'exceptions')
+    FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+    FIELDS = Event.FIELDS + (
+        'freq', 'interval', 'count', 'until', 'exceptions')
+
+    def __init__(self, caption, start, end=None, freq='weekly', interval=1,
+            count=None, until=None, exceptions=None, **kwargs):
+        assert freq in self.FREQUENCIES
+        assert interval > 0
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.exceptions = set(exceptions or [])
+        super(RecurringEvent, self).__init__(caption, start, end, **kwargs)
+
+    def __setattr__(self, name, value):
+        super(RecurringEvent, self).__setattr__(name, value)
+        if (not name.startswith('_')
+                and getattr(self, '_store', None) is not None):
+            self._store._refresh(self)
+
+    def _copy(self):
+        event = super(RecurringEvent, self)._copy()
+        object.__setattr__(event, 'exceptions', set(self.exceptions))
+        return event
+
+    def _months(self):
+        return {'monthly': 1, 'yearly': 12}.get(self.freq, 0) * self.interval
+
+    def _nth_start(self, n):
+        """
+        Return the start of the nth repetition or None if its day does not
+        exist.
+        """
+        if self.freq == 'daily':
+            return self.start + datetime.timedelta(days=n * self.interval)
+        elif self.freq == 'weekly':
+            return self.start + datetime.timedelta(weeks=n * self.interval)
+        return util.add_months(self.start, n * self._months())
+
+    def _first_index(self, start, duration):
+        "Return a repetition index which does not end after start"
+        # The all day events start at a date
+        origin = util.key_datetime(util.datetime_key(self.start))
+        start = util.key_datetime(util.datetime_key(start)) - duration
+        if start <= origin:
+            return 0
+        if self.freq in {'daily', 'weekly'}:
+            period = self._nth_start(1) - self.start
+            return (start - origin) // period
+        months = ((start.year - origin.year) * 12
+            + start.month - origin.month)
+        return max(months // self._months() - 1, 0)
+
+    def expand(self, start, end):
+        """
+        Yield the index, the start and the end of the occurrences which may
+        intersect the range.
+        """
+        duration = (self.end - self.start if self.end is not None
+            else datetime.timedelta())
+        # The dates and the datetimes are compared by their keys
+        end_key = util.datetime_key(end)
+        until_key = (util.datetime_key(self.until)
+            if self.until is not None else None)
+        exceptions = {util.datetime_key(e) for e in self.exceptions}
+        # The days missing in some months are skipped but still counted
+        skip = (self.freq == 'monthly' and self.start.day > 28
+            or self.freq == 'yearly'
+            and (self.start.month, self.start.day) == (2, 29))
+        if skip and self.count is not None:
+            n = 0
+        else:
+            n = self._first_index(start, duration)
+        counted = n
+        while self.count is None or counted < self.count:
+            try:
+                occurrence_start = self._nth_start(n)
+            except OverflowError:
+                return
+            n += 1
+            if occurrence_start is None:
+                continue
+            counted += 1
+            start_key = util.datetime_key(occurrence_start)
+            if (start_key > end_key
+                    or until_key is not None and start_key > until_key):
+                return
+            if start_key in exceptions:
+                continue
+            occurrence_end = (occurrence_start + duration
+                if self.end is not None else None)
+            yield n - 1, occurrence_start, occurrence_end
+
+
+class Occurrence(Event):
+    """
+    This class represents an occurrence of a recurring event.
+    """
+    __slots__ = ('recurrence', 'index')
+
+    def __init__(self, recurrence, index, start, end=None):
+        super(Occurrence, self).__init__(recurrence.caption, start, end,
+            all_day=recurrence.all_day, editable=False,
+            text_color=recurrence.text_color, bg_color=recurrence.bg_color)
+        self.recurrence = recurrence
+        self.index = index
+        self.__dict__.update(recurrence.__dict__)
+
+
+class Subscription(object):
+    """
+    This class represents a callback of the changes of an event store which
+    intersect a range.
+    """
+
+    def __init__(self, store, callback, start=None, end=None):
+        self.store = store
+        self.callback = callback
+        self.start = start
+        self.end = end
+
+    def set_range(self, start, end):
+        self.start = start
+        self.end = end
+
+    def cancel(self):
+        if self in self.store._subscriptions:
+            self.store._subscriptions.remove(self)
+
+    def _intersects(self, event, interval=None):
+        if not self.start and not self.end:
+            return True
+        if isinstance(event, RecurringEvent):
+            # Its occurrences may be in the range
+            return True
+        start, end = interval or (event.start, event.end)
+        return util.interval_intersects(start, end, self.start, self.end)
+
+    def _notify(self, added, removed, changed):
+        if hasattr(added, 'intersecting'):
+            # Only the events of the rows in the range are created
+            if self.start or self.end:
+                added = added.intersecting(self.start, self.end)
+            added = list(added)
+        else:
+            added = [e for e in added if self._intersects(e)]
+        removed = [e for e in removed if self._intersects(e)]
+        changed = [(e, old, new) for e, old, new in changed
+            if self._intersects(e, old) or self._intersects(e, new)]
+        if added or removed or changed:
+            self.callback(added, removed, changed)
+
+
+class EventSnapshot(object):
+    """
+    This class is a read only view of the events of an event store at a
+    point in time. It can be read from any thread while the store changes.
+    The events returned are copies which are not in the store.
+    """
+
+    def __init__(self, version, index, events, recurring, next_id=None):
+        self.version = version
+        self._index = index
+        self._events = events
+        self._recurring = recurring
+        self._next_id = next_id
+        # The events as they were before changing in the store
+        self._frozen = {}
+
+    def _get(self, id_):
+        event = self._events.get(id_)
+        if event is not None:
+            event = event._copy()
+        # The copy may be torn if the event has been preserved meanwhile
+        frozen = self._frozen.get(id_)
+        if frozen is not None:
+            event = frozen._copy()
+        return event
+
+    def get_events(self, start=None, end=None, where=None):
+        """
+        Returns a list of all events that intersect with the given start
+        and end times when the snapshot was taken.
+        where is a dictionary of attribute values that the events must have.
+        """
+        if not start and not end:
+            events = [self._get(i) for i in self._index.keys()]
+            events.extend(e._copy() for e in self._recurring)
+        else:
+            end = end if end else start
+            start_key, end_key = util.range_keys(start, end)
+            events = []
+            for key in sorted(self._index.search(start_key, end_key)):
+                event = self._get(key)
+                if util.keys_intersect(
+                        *util.event_keys(event), start_key, end_key):
+                    events.append(event)
+            for recurrence in self._recurring:
+                for n, occurrence_start, occurrence_end in recurrence.expand(
+                        start, end):
+                    occurrence = Occurrence(recurrence, n,
+                        occurrence_start, occurrence_end)
+                    if util.keys_intersect(
+                            *util.event_keys(occurrence), start_key, end_key):
+                        events.append(occurrence)
+        if where:
+            events = [e for e in events
+                if all(getattr(e, n, None) == v for n, v in where.items())]
+        return events
+
+    @classmethod
+    def from_events(cls, store):
+        "Returns a snapshot of copies of all the events of the store"
+        index, events, recurring = IntervalIndex(), {}, []
+        for event in store.get_events():
+            event = event._copy()
+            if isinstance(event, RecurringEvent):
+                recurring.append(event)
+            else:
+                key = len(events)
+                events[key] = event
+                index.add(key, *util.event_keys(event))
+        return cls(store.version, index, events, recurring)
 
 
 class EventStore(GObject.GObject):
+    MAX_EXPANSIONS = 8
+    MAX_FILTERED = 16
+
     __gsignals__ = {
         'event-removed': (GObject.SignalFlags.RUN_FIRST,
             GObject.TYPE_NONE,
@@ -58,46 +386,699 @@ class EventStore(GObject.GObject):
             GObject.TYPE_NONE,
             (GObject.TYPE_PYOBJECT,)),
         'events-cleared': (GObject.SignalFlags.RUN_FIRST,
-            GObject.TYPE_NONE, ())}
+            GObject.TYPE_NONE, ()),
+        'events-changed': (GObject.SignalFlags.RUN_FIRST,
+            GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,
+                GObject.TYPE_PYOBJECT)),
+        'event-changed': (GObject.SignalFlags.RUN_FIRST,
+            GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,
+                GObject.TYPE_PYOBJECT)),
+        }
 
     def __init__(self):
         super(EventStore, self).__init__()
         self._next_event_id = 0
         self._events = {}
+        self._index = IntervalIndex()
+        self._batch_level = 0
+        self._batch_added = {}
+        self._batch_removed = {}
+        self._batch_changed = {}
+        self._recurring = {}
+        self._next_recurring_id = -1
+        self._expansions = collections.OrderedDict()
+        self._occurrences = weakref.WeakValueDictionary()
+        self._external_ids = {}
+        self._external_keys = {}
+        self._attribute_indexes = {}
+        self._attribute_values = {}
+        self._filtered = collections.OrderedDict()
+        self._version = 0
+        self._subscriptions = []
+        # The captions are indexed from the first search
+        self._tokens = None
+        # The days are indexed from the first aggregate
+        self._days = None
+        self._snapshots = weakref.WeakSet()
+
+    def _refresh(self, event):
+        "Update the store after a change of the event"
+        if isinstance(event, RecurringEvent):
+            self._expansions.clear()
+            self._occurrences.clear()
+        else:
+            self._reindex(event)
+        self._track([event])
+
+    @property
+    def version(self):
+        "A number increased on every change of the events"
+        return self._version
+
+    def _changed(self):
+        self._version += 1
+        self._filtered.clear()
+
+    def _track(self, events):
+        "Index the attributes of the events"
+        self._changed()
+        if (self._tokens is None and self._days is None
+                and not self._attribute_indexes):
+            return
+        # The removed events must not be indexed again
+        events = [e for e in events if e.id is not None and e._store is self]
+        if self._tokens is not None:
+            for event in events:
+                self._tokens.update(event.id, event.caption)
+        if self._days is not None:
+            for event in events:
+                if not isinstance(event, RecurringEvent):
+                    self._days.update(event.id, *util.event_keys(event))
+        if not self._attribute_indexes:
+            return
+        for name, index in self._attribute_indexes.items():
+            values = self._attribute_values[name]
+            for event in events:
+                value = getattr(event, name, None)
+                old = values.get(event.id, _missing)
+                if old == value:
+                    continue
+                if old is not _missing:
+                    index[old].discard(event.id)
+                index.setdefault(value, set()).add(event.id)
+                values[event.id] = value
+
+    def _untrack(self, event):
+        "Remove the event from the attribute indexes"
+        self._changed()
+        if self._tokens is not None and event.id in self._tokens:
+            self._tokens.remove(event.id)
+        if self._days is not None and event.id in self._days:
+            self._days.remove(event.id)
+        for name, index in self._attribute_indexes.items():
+            value = self._attribute_values[name].pop(event.id, _missing)
+            if value is not _missing:
+                ids = index[value]
+                ids.discard(event.id)
+                if not ids:
+                    del index[value]
+
+    def add_attribute_index(self, name):
+        """
+        Index the events by the value of the attribute to filter them in
+        get_events.
+        """
+        if name in self._attribute_indexes:
+            return
+        self._attribute_indexes[name] = {}
+        self._attribute_values[name] = {}
+        self._track(self.get_events())
+
+    def _reindex(self, event):
+        self._index.remove(event.id)
+        self._index.add(event.id, *util.event_keys(event))
+
+    def _lookup(self, id_):
+        "Return the event of the id"
+        if id_ < 0:
+            return self._recurring[id_]
+        return self._events[id_]
+
+    def _insert(self, event):
+        self._insert_many([event])
+
+    def _insert_recurring(self, event):
+        assert event.id is None
+        event.id = self._next_recurring_id
+        self._recurring[event.id] = event
+        event._store = self
+        self._next_recurring_id -= 1
+
+    def _delete_recurring(self, event):
+        del self._recurring[event.id]
+
+    def _insert_many(self, events):
+        "Insert the events with a single update of the time index"
+        intervals = []
+        for event in events:
+            assert event.id is None
+            self._events[self._next_event_id] = event
+            event.id = self._next_event_id
+            event._store = self
+            self._next_event_id += 1
+            intervals.append((event.id,) + util.event_keys(event))
+        self._index.add_many(intervals)
+
+    def _preserve(self, event):
+        "Keep the event in the snapshots before it changes"
+        if not self._snapshots or event.id is None or event.id < 0:
+            return
+        copy = None
+        for snapshot in self._snapshots:
+            if (event.id < snapshot._next_id
+                    and event.id not in snapshot._frozen):
+                if copy is None:
+                    copy = event._copy()
+                snapshot._frozen[event.id] = copy
+
+    def _delete(self, event):
+        self._preserve(event)
+        del self._events[event.id]
+        self._index.remove(event.id)
+        event._store = None
+
+    def __contains__(self, event):
+        "Return if the event is in the store"
+        return event._store is self
 
     def remove(self, event):
         assert event is not None
         if event.id is None:
             return
-        del self._events[event.id]
-        self.emit('event-removed', event)
+        self._unlink(event)
+        self._untrack(event)
+        if isinstance(event, RecurringEvent):
+            self._delete_recurring(event)
+            # Without store, the change of id is not refreshed
+            event._store = None
+            event.id = None
+            self._refresh(event)
+        else:
+            self._delete(event)
+        if self._batch_level:
+            self._batch_changed.pop(id(event), None)
+            if self._batch_added.pop(id(event), None) is None:
+                self._batch_removed[id(event)] = event
+        else:
+            self.emit('event-removed', event)
+            self._publish([], [event], [])
+
+    def remove_events(self, events):
+        with self.batch():
+            for event in events:
+                self.remove(event)
 
     def add(self, event):
         assert event is not None
         self.add_events([event])
 
     def add_events(self, events):
+        inserted = []
         for event in events:
-            assert event.id is None
-            self._events[self._next_event_id] = event
-            event.id = self._next_event_id
-            self._next_event_id += 1
-        self.emit('event-added', events)
+            if isinstance(event, RecurringEvent):
+                self._insert_recurring(event)
+                self._refresh(event)
+            else:
+                inserted.append(event)
+        self._insert_many(inserted)
+        self._notify_added(events)
 
-    def clear(self):
-        self._events.clear()
+    def _notify_added(self, events):
+        self._track(events)
+        if self._batch_level:
+            for event in events:
+                self._batch_added[id(event)] = event
+        else:
+            self.emit('event-added', events)
+            self._publish(events, [], [])
+
+    def _reset(self):
+        for event in self._events.values():
+            event._store = None
+        # The snapshots keep the previous events
+        self._events = {}
+        self._index.clear()
         self._next_event_id = 0
-        self.emit('events-cleared')
 
-    def get_events(self, start=None, end=None):
+    def clear(self):
+        if self._batch_level:
+            for event in self.get_events():
+                self._batch_changed.pop(id(event), None)
+                if self._batch_added.pop(id(event), None) is None:
+                    self._batch_removed[id(event)] = event
+        else:
+            # Only the events in the ranges of the subscriptions are needed
+            removed = [(s, self.get_events(s.start, s.end))
+                for s in self._subscriptions]
+        self._reset()
+        self._snapshots.clear()
+        for event in self._recurring.values():
+            event.id = None
+            event._store = None
+        self._recurring.clear()
+        self._next_recurring_id = -1
+        self._external_ids.clear()
+        self._external_keys.clear()
+        for name in self._attribute_indexes:
+            self._attribute_indexes[name].clear()
+            self._attribute_values[name].clear()
+        if self._tokens is not None:
+            self._tokens.clear()
+        if self._days is not None:
+            self._days.clear()
+        self._changed()
+        self._expansions.clear()
+        self._occurrences.clear()
+        if not self._batch_level:
+            self.emit('events-cleared')
+            for subscription, events in removed:
+                subscription._notify([], events, [])
+
+    def update_event(self, event, **changes):
         """
-        Returns a list of all events that intersect with the given start
-        and end times.
+        Set the given attributes on the event and emit event-changed with the
+        old and the new (start, end) intervals.
+        """
+        assert event is not None
+        # The id of a removed event may be used by another event
+        if event not in self:
+            raise ValueError("%r is not in the store" % event)
+        old = (event.start, event.end)
+        self._preserve(event)
+        store, event._store = event._store, None
+        try:
+            for name, value in changes.items():
+                setattr(event, name, value)
+        finally:
+            event._store = store
+        if event.end is not None:
+            assert event.start <= event.end
+        new = (event.start, event.end)
+        self._refresh(event)
+        if self._batch_level:
+            if id(event) not in self._batch_added:
+                self._batch_changed.setdefault(id(event), (event, old))
+            return
+        if isinstance(event, RecurringEvent):
+            # All the occurrences may have changed
+            self.emit('events-changed', [], [], [event])
+        else:
+            self.emit('event-changed', event, old, new)
+        self._publish([], [], [(event, old, new)])
+
+    def apply_delta(self, upserts, deletions=()):
+        """
+        Apply the changes keyed by external identifiers and emit them in a
+        single events-changed signal.
+        upserts is a mapping of key to event: the event of an unknown key is
+        added and otherwise its attributes are copied on the event already
+        stored. deletions is an iterable of the keys to remove.
+        """
+        with self.batch():
+            for key in deletions:
+                id_ = self._external_ids.get(key)
+                if id_ is not None:
+                    self.remove(self._lookup(id_))
+            added = []
+            for key, new in upserts.items():
+                id_ = self._external_ids.get(key)
+                if id_ is not None:
+                    event = self._lookup(id_)
+                    if type(event) is type(new):
+                        changes = {f: getattr(new, f) for f in new.FIELDS
+                            if getattr(event, f) != getattr(new, f)}
+                        changes.update((n, v) for n, v in new.__dict__.items()
+                            if getattr(event, n, None) != v)
+                        if changes:
+                            self.update_event(event, **changes)
+                        continue
+                    self.remove(event)
+                added.append((key, new))
+            if added:
+                self.add_events([event for _, event in added])
+            for key, event in added:
+                self._link(key, event)
+
+    def _link(self, key, event):
+        "Map the external key to the stored event"
+        self._external_ids[key] = event.id
+        self._external_keys[event.id] = key
+
+    def _unlink(self, event):
+        "Forget the external key of the event if any"
+        key = self._external_keys.pop(event.id, None)
+        if key is not None:
+            del self._external_ids[key]
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Returns a context manager which collects the events added, removed and
+        changed within it and emits them in a single events-changed signal on
+        exit.
+        """
+        self._batch_level += 1
+        try:
+            yield self
+        finally:
+            self._batch_level -= 1
+            if not self._batch_level:
+                added = list(self._batch_added.values())
+                removed = list(self._batch_removed.values())
+                changed = [(e, old, (e.start, e.end))
+                    for e, old in self._batch_changed.values()]
+                self._batch_added.clear()
+                self._batch_removed.clear()
+                self._batch_changed.clear()
+                if added or removed or changed:
+                    self.emit('events-changed', added, removed,
+                        [e for e, _, _ in changed])
+                    self._publish(added, removed, changed)
+
+    def search(self, text, start=None, end=None):
+        """
+        Returns the list ordered by date of the events whose caption has, for
+        each word of text, a word starting with it and which intersect with
+        the given start and end times if any. A missing start or end does not
+        bound the range and the recurring events are then not expanded.
+        """
+        if self._tokens is None:
+            self._tokens = TokenIndex()
+            for event in self.get_events():
+                self._tokens.add(event.id, event.caption)
+        ids = self._tokens.search(text)
+        ranged, bounded = start or end, start and end
+        start_key, end_key = util.bound_keys(start, end)
+        events = []
+        for id_ in ids:
+            if bounded and id_ < 0:
+                continue
+            event = self._lookup(id_)
+            if not ranged:
+                events.append(event)
+            elif id_ < 0:
+                if self._recurs(event, start, end):
+                    events.append(event)
+            elif util.keys_intersect(
+                    *util.event_keys(event), start_key, end_key):
+                events.append(event)
+        if bounded and self._recurring and any(i < 0 for i in ids):
+            events.extend(e for e in self._expand(start, end)
+                if e.recurrence.id in ids)
+        events.sort(key=util.event_keys)
+        return events
+
+    def _day_indexes(self, first, last):
+        "Return the DayIndex of the events and the occurrences in the days"
+        if self._days is None:
+            self._days = DayIndex((e.id,) + util.event_keys(e)
+                for e in self.get_events()
+                if not isinstance(e, RecurringEvent))
+        if not self._recurring:
+            return [self._days]
+        # The occurrences are indexed for the range only
+        occurrences = DayIndex((i,) + util.event_keys(e)
+            for i, e in enumerate(self._expand(
+                    datetime.datetime.fromordinal(first),
+                    datetime.datetime.fromordinal(last + 1))))
+        return [self._days, occurrences]
+
+    def aggregate(self, start, end, by='day'):
+        """
+        Returns the list of the (date, count, minutes) of each day, week or
+        month from the day of start to the day of end, where count is the
+        number of events intersecting it and minutes their busy time in it.
+        The weeks start on Monday and date is the first day in the range.
+        The days are indexed from the first call and the index is kept up to
+        date with the changes of the store.
         """
+        assert by in {'day', 'week', 'month'}
+        first, last = start.toordinal(), end.toordinal()
+        indexes = self._day_indexes(first, last)
+        result = []
+        for days in zip(*(index.days(first, last) for index in indexes)):
+            day = days[0][0]
+            date = datetime.date.fromordinal(day)
+            duration = sum(d for _, _, d in days)
+            if by == 'day':
+                result.append([date, sum(c for _, c, _ in days), duration])
+                continue
+            elif by == 'week':
+                new = not date.weekday()
+                bucket_last = day + 6 - date.weekday()
+            else:
+                new = date.day == 1
+                bucket_last = util.add_months(
+                    date.replace(day=1), 1).toordinal() - 1
+            if result and not new:
+                result[-1][2] += duration
+                continue
+            count = sum(index.count(day, min(bucket_last, last))
+                for index in indexes)
+            result.append([date, count, duration])
+        return [(date, count, duration * 1440 // util.DAY_KEY)
+            for date, count, duration in result]
+
+    def find_conflicts(self, start, end, key=None):
+        """
+        Returns a dictionary of the groups of overlapping events in the range
+        by their value of key, an attribute name or a callable. Without key,
+        all the events are in the group of None.
+        Only the values with conflicts are returned.
+        """
+        if isinstance(key, str):
+            name = key
+
+            def key(event):
+                return getattr(event, name, None)
+        by_key = collections.defaultdict(list)
+        for event in self.get_events(start, end):
+            by_key[key(event) if key else None].append(event)
+        conflicts = {}
+        for value, events in by_key.items():
+            groups = util.overlapping_groups(events)
+            if groups:
+                conflicts[value] = groups
+        return conflicts
+
+    def find_free_slots(self, start, end, duration, granularity=15,
+            hours=None, where=None):
+        """
+        Yield the (start, end) of the free slots of duration in the range
+        starting every granularity minutes of the day and, if hours is a pair
+        of datetime.time, within these hours of each day.
+        The events without duration do not make the time busy.
+        The events are fetched by week only when the slots reach it.
+        """
+        step = datetime.timedelta(minutes=granularity)
+
+        def align(value):
+            "Return the first slot start not before the value"
+            day = datetime.datetime.combine(value.date(), datetime.time())
+            return day + -(-(value - day) // step) * step
+
+        slot = align(start)
+        while slot + duration <= end:
+            chunk_end = min(slot + datetime.timedelta(weeks=1), end)
+            # Merge the busy intervals in one pass over the sorted events
+            busy = []
+            for event_start, event_end in sorted(map(util.event_keys,
+                        self.get_events(slot, chunk_end + duration, where))):
+                if event_start >= event_end:
+                    continue
+                if busy and event_start <= busy[-1][1]:
+                    busy[-1][1] = max(busy[-1][1], event_end)
+                else:
+                    busy.append([event_start, event_end])
+            i = 0
+            while slot < chunk_end and slot + duration <= end:
+                if hours:
+                    day = slot.date()
+                    opening = datetime.datetime.combine(day, hours[0])
+                    closing = datetime.datetime.combine(day, hours[1])
+                    if slot < opening:
+                        slot = align(opening)
+                        continue
+                    elif slot + duration > closing:
+                        slot = align(datetime.datetime.combine(
+                                day + datetime.timedelta(days=1), hours[0]))
+                        continue
+                slot_start = util.datetime_key(slot)
+                while i < len(busy) and busy[i][1] <= slot_start:
+                    i += 1
+                if (i < len(busy)
+                        and busy[i][0] < util.datetime_key(slot + duration)):
+                    slot = align(util.key_datetime(busy[i][1]))
+                    continue
+                yield slot, slot + duration
+                slot += step
+
+    def subscribe(self, callback, start=None, end=None):
+        """
+        Returns a Subscription calling callback with the lists of the added
+        events, the removed events and the (event, old, new) of the changed
+        events which intersect the range.
+        """
+        subscription = Subscription(self, callback, start, end)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def snapshot(self):
+        """
+        Returns an EventSnapshot of the events which can be read from other
+        threads while the store changes. It shares the index with the store
+        until it changes and must be taken from the thread changing the store.
+        """
+        snapshot = EventSnapshot(self.version, self._index.share(),
+            self._events, [e._copy() for e in self._recurring.values()],
+            self._next_event_id)
+        self._snapshots.add(snapshot)
+        return snapshot
+
+    def _publish(self, added, removed, changed):
+        for subscription in list(self._subscriptions):
+            subscription._notify(added, removed, changed)
+
+    def save_snapshot(self, path):
+        """
+        Write all the events in a snapshot file which can be opened with
+        open_snapshot.
+        """
+        from ._snapshot import write_snapshot
+        write_snapshot(path, self.get_events())
+
+    def import_ics(self, files, batch_size=1000, processes=None,
+            progress=None):
+        """
+        Add the events of the iCalendar files, paths or text files, by
+        batches and return their number. The batches are parsed by a pool of
+        processes only if processes is greater than one.
+        progress is called with the number of events added after each batch.
+        """
+        from ._ical import import_ics
+        return import_ics(self, files, batch_size, processes, progress)
+
+    def export_ics(self, fileobj, start=None, end=None):
+        """
+        Write the events which intersect with the given start and end times
+        in the iCalendar text file by time and return their number.
+        """
+        from ._ical import export_ics
+        return export_ics(self, fileobj, start, end)
+
+    @staticmethod
+    def open_snapshot(path):
+        """
+        Returns an event store reading the events of the snapshot file only
+        when they are queried.
+        """
+        from ._snapshot import SnapshotEventStore
+        return SnapshotEventStore(path)
+
+    def _query(self, start, end):
         if not start and not end:
             return list(self._events.values())
+        start, end = util.range_keys(start, end)
         events = []
-        for event in list(self._events.values()):
-            if util.event_intersects(event, start, end):
+        for key in sorted(self._index.search(start, end)):
+            event = self._events[key]
+            if util.keys_intersect(*util.event_keys(event), start, end):
                 events.append(event)
         return events
+
+    def _ordered(self, start, end):
+        "Yield the events which may intersect the keys sorted by their keys"
+        # The shared bins are not changed by the store while iterating
+        index = self._index.share()
+        for key in index.iter_sorted(start, end):
+            event = self._events.get(key)
+            if event is not None:
+                yield event
+
+    def _recurs(self, recurrence, start, end):
+        "Return if an occurrence of the recurring event is in the range"
+        start_key, end_key = util.bound_keys(start, end)
+        for _, occurrence_start, occurrence_end in recurrence.expand(
+                start or recurrence.start, end or datetime.datetime.max):
+            if util.keys_intersect(util.datetime_key(occurrence_start),
+                    util.datetime_key(occurrence_end or occurrence_start),
+                    start_key, end_key):
+                return True
+        return False
+
+    def iter_events(self, start=None, end=None):
+        """
+        Returns a generator of the events which intersect with the given
+        start and end times sorted by time. A missing start or end does not
+        bound the range. The recurring events are not expanded.
+        """
+        start_key, end_key = util.bound_keys(start, end)
+        events = (e for e in self._ordered(start_key, end_key)
+            if util.keys_intersect(*util.event_keys(e), start_key, end_key))
+        recurring = sorted((r for r in self._recurring.values()
+                if not start and not end or self._recurs(r, start, end)),
+            key=util.event_keys)
+        return heapq.merge(events, recurring, key=util.event_keys)
+
+    def _expand(self, start, end):
+        "Return the occurrences of the recurring events in the range"
+        key = (start, end)
+        if key in self._expansions:
+            self._expansions.move_to_end(key)
+            return list(self._expansions[key])
+        events = []
+        start_key, end_key = util.range_keys(start, end)
+        for recurrence in self._recurring.values():
+            for n, occurrence_start, occurrence_end in recurrence.expand(
+                    start, end):
+                occurrence = self._occurrences.get((recurrence.id, n))
+                if occurrence is None:
+                    occurrence = Occurrence(recurrence, n,
+                        occurrence_start, occurrence_end)
+                    self._occurrences[recurrence.id, n] = occurrence
+                if util.keys_intersect(
+                        *util.event_keys(occurrence), start_key, end_key):
+                    events.append(occurrence)
+        self._expansions[key] = events
+        if len(self._expansions) > self.MAX_EXPANSIONS:
+            self._expansions.popitem(last=False)
+        return list(events)
+
+    def _filter(self, events, where):
+        "Return the events whose attributes have the values of where"
+        for name, value in where.items():
+            ids = None
+            if name in self._attribute_indexes:
+                ids = self._attribute_indexes[name].get(value, ())
+            events = [e for e in events
+                if (getattr(e, 'recurrence', e).id in ids if ids is not None
+                    else getattr(e, name, None) == value)]
+        return events
+
+    def get_events(self, start=None, end=None, where=None):
+        """
+        Returns a list of all events that intersect with the given start
+        and end times.
+        The recurring events are expanded into their occurrences only when a
+        range is given.
+        where is a dictionary of attribute values that the events must have.
+        The last filtered results are cached until the store changes.
+        """
+        if where:
+            key = (start, end, tuple(sorted(where.items())))
+            if key in self._filtered:
+                self._filtered.move_to_end(key)
+                return list(self._filtered[key])
+        if where and not start and not end and all(
+                n in self._attribute_indexes for n in where):
+            # Fetch only the indexed events
+            ids = set.intersection(*(
+                    self._attribute_indexes[n].get(v, set())
+                    for n, v in where.items()))
+            events = [self._lookup(i) for i in sorted(ids)]
+        else:
+            events = self._query(start, end)
+            if not start and not end:
+                events.extend(self._recurring.values())
+            elif self._recurring:
+                events.extend(self._expand(start, end if end else start))
+            if where:
+                events = self._filter(events, where)
+        if where:
+            self._filtered[key] = events
+            if len(self._filtered) > self.MAX_FILTERED:
+                self._filtered.popitem(last=False)
+            events = list(events)
+        return events
@@ -0,0 +1,396 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import collections
+import concurrent.futures
+import datetime
+import os
+import re
+import uuid
+import zoneinfo
+
+from ._event import Event, RecurringEvent
+
+_PARAMETER = re.compile(r';([^=;:]+)=("[^"]*"|[^;:]*)')
+_ESCAPED = re.compile(r'\\(.)')
+_DURATION = re.compile(
+    r'([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+FREQUENCIES = {
+    'DAILY': 'daily',
+    'WEEKLY': 'weekly',
+    'MONTHLY': 'monthly',
+    'YEARLY': 'yearly',
+    }
+
+
+def unfold(lines):
+    "Yield the content lines of the iCalendar lines joining the folded ones"
+    parts = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in {' ', '\t'}:
+            parts.append(line[1:])
+            continue
+        if parts:
+            yield ''.join(parts)
+        parts = [line] if line else []
+    if parts:
+        yield ''.join(parts)
+
+
+def parse_line(line):
+    "Return the name, the parameters and the value of a content line"
+    index = line.find(':')
+    head, value = line[:index], line[index + 1:]
+    if ';' not in head:
+        return head.upper(), {}, value
+    name = head[:head.index(';')]
+    # The quoted parameter values may contain a colon
+    parameters = {}
+    end = len(name)
+    for match in _PARAMETER.finditer(line, end):
+        if match.start() != end:
+            break
+        parameters[match.group(1).upper()] = match.group(2).strip('"')
+        end = match.end()
+    return name.upper(), parameters, line[end + 1:]
+
+
+def unescape(value):
+    "Return the text value without its escapes"
+    if '\\' not in value:
+        return value
+    return _ESCAPED.sub(
+        lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def _get_zone(tzid):
+    "Return the time zone of the TZID or None if it is unknown"
+    try:
+        return zoneinfo.ZoneInfo(tzid.strip('/'))
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def parse_datetime(value, tzid=None):
+    """
+    Return the date or the naive datetime of the value.
+    The UTC datetimes and those of a known tzid are converted into the local
+    time.
+    """
+    date = datetime.date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    if len(value) <= 8:
+        return date
+    result = datetime.datetime(date.year, date.month, date.day,
+        int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if value.endswith('Z'):
+        zone = datetime.timezone.utc
+    else:
+        zone = _get_zone(tzid) if tzid else None
+    if zone is not None:
+        result = result.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+    return result
+
+
+def parse_duration(value):
+    "Return the timedelta of the duration value"
+    match = _DURATION.match(value)
+    if not match:
+        raise ValueError("Invalid duration %r" % value)
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = datetime.timedelta(weeks=int(weeks or 0), days=int(days or 0),
+        hours=int(hours or 0), minutes=int(minutes or 0),
+        seconds=int(seconds or 0))
+    return -duration if sign == '-' else duration
+
+
+def _to_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.combine(value, datetime.time())
+
+
+def format_datetime(value):
+    """
+    Return the iCalendar value of the date or the datetime.
+    The aware datetimes are written in UTC.
+    """
+    if isinstance(value, datetime.datetime):
+        utc = value.utcoffset() is not None
+        if utc:
+            value = value.astimezone(datetime.timezone.utc)
+        return '%04d%02d%02dT%02d%02d%02d%s' % (value.year, value.month,
+            value.day, value.hour, value.minute, value.second,
+            'Z' if utc else '')
+    return '%04d%02d%02d' % (value.year, value.month, value.day)
+
+
+def escape(value):
+    "Return the text value with its special characters escaped"
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def fold(line):
+    "Return the content line folded in lines of 75 octets"
+    if len(line.encode('utf-8')) <= 75:
+        return line + '\r\n'
+    lines, size, begin = [], 0, 0
+    for i, char in enumerate(line):
+        width = len(char.encode('utf-8'))
+        # The continuation lines start with a space
+        if size + width > (75 if not lines else 74):
+            lines.append(line[begin:i])
+            size, begin = 0, i
+        size += width
+    lines.append(line[begin:])
+    return '\r\n '.join(lines) + '\r\n'
+
+
+def format_event(event, uid, stamp):
+    "Return the VEVENT component of the event"
+    start = _to_datetime(event.start)
+    end = _to_datetime(event.end or event.start)
+    if event.all_day:
+        # The end of the all day events is the next day
+        dates = 'DTSTART;VALUE=DATE:%s\r\nDTEND;VALUE=DATE:%s\r\n' % (
+            format_datetime(start.date()),
+            format_datetime((end + datetime.timedelta(days=1)).date()))
+    else:
+        dates = 'DTSTART:%s\r\nDTEND:%s\r\n' % (
+            format_datetime(start), format_datetime(end))
+    # Only the lines of variable length may need to be folded
+    component = 'BEGIN:VEVENT\r\nUID:%s\r\nDTSTAMP:%s\r\n%s%s' % (
+        uid, stamp, fold('SUMMARY:' + escape(event.caption)), dates)
+    if event.bg_color:
+        component += fold('COLOR:' + event.bg_color)
+    if isinstance(event, RecurringEvent):
+
+        def convert(value):
+            "Return the value with the same type as DTSTART"
+            value = _to_datetime(value)
+            return value.date() if event.all_day else value
+
+        rule = 'RRULE:FREQ=%s;INTERVAL=%d' % (
+            event.freq.upper(), event.interval)
+        if event.count is not None:
+            rule += ';COUNT=%d' % event.count
+        if event.until is not None:
+            rule += ';UNTIL=' + format_datetime(convert(event.until))
+        component += fold(rule)
+        if event.exceptions:
+            exdate = 'EXDATE;VALUE=DATE:' if event.all_day else 'EXDATE:'
+            component += fold(exdate + ','.join(
+                    format_datetime(convert(d))
+                    for d in sorted(event.exceptions, key=_to_datetime)))
+    return component + 'END:VEVENT\r\n'
+
+
+def parse_event(properties):
+    """
+    Return the uid, the recurrence id and the record of the VEVENT
+    properties. The record is None if the event is cancelled.
+    """
+    uid = properties.get('UID', (None, None))[1]
+    recurrence_id = properties.get('RECURRENCE-ID')
+    if recurrence_id is not None:
+        recurrence_id = _to_datetime(parse_datetime(
+                recurrence_id[1], recurrence_id[0].get('TZID')))
+    if (properties.get('STATUS', (None, ''))[1].upper() == 'CANCELLED'
+            or 'DTSTART' not in properties):
+        return uid, recurrence_id, None
+    parameters, value = properties['DTSTART']
+    start = parse_datetime(value, parameters.get('TZID'))
+    all_day = not isinstance(start, datetime.datetime)
+    start = _to_datetime(start)
+    if 'DTEND' in properties:
+        parameters, value = properties['DTEND']
+        end = _to_datetime(parse_datetime(value, parameters.get('TZID')))
+    elif 'DURATION' in properties:
+        end = start + parse_duration(properties['DURATION'][1])
+    else:
+        end = start + datetime.timedelta(days=1) if all_day else start
+    if all_day:
+        # The end of the all day events is the last day
+        end = end - datetime.timedelta(days=1)
+        if end <= start:
+            end = None
+    end = max(end, start) if end is not None else None
+    record = {
+        'caption': unescape(properties.get('SUMMARY', (None, ''))[1]),
+        'start': start,
+        'end': end,
+        'all_day': all_day,
+        }
+    if 'COLOR' in properties:
+        record['bg_color'] = properties['COLOR'][1]
+    rule = properties.get('RRULE')
+    if rule is not None and recurrence_id is None:
+        parts = dict(p.split('=', 1) for p in rule[1].upper().split(';')
+            if '=' in p)
+        if parts.get('FREQ') in FREQUENCIES:
+            record['freq'] = FREQUENCIES[parts['FREQ']]
+            record['interval'] = int(parts.get('INTERVAL', 1))
+            if 'COUNT' in parts:
+                record['count'] = int(parts['COUNT'])
+            if 'UNTIL' in parts:
+                until = parse_datetime(parts['UNTIL'])
+                if not isinstance(until, datetime.datetime):
+                    until = datetime.datetime.combine(until, datetime.time.max)
+                record['until'] = until
+            exceptions = record['exceptions'] = []
+            for parameters, value in properties.get('EXDATE', ()):
+                value = parse_datetime(value, parameters.get('TZID'))
+                if not isinstance(value, datetime.datetime):
+                    value = datetime.datetime.combine(value, start.time())
+                exceptions.append(value)
+    return uid, recurrence_id, record
+
+
+def parse_events(lines):
+    """
+    Return the uid, the recurrence id and the record of the VEVENT components
+    of the lines. The components nested in the events are skipped.
+    """
+    result = []
+    properties, depth = None, 0
+    for line in unfold(lines):
+        name, parameters, value = parse_line(line)
+        if name == 'BEGIN':
+            if value.upper() == 'VEVENT' and properties is None:
+                properties, depth = {}, 0
+            elif properties is not None:
+                depth += 1
+        elif name == 'END' and properties is not None:
+            if depth:
+                depth -= 1
+            elif value.upper() == 'VEVENT':
+                result.append(parse_event(properties))
+                properties = None
+        elif properties is not None and not depth:
+            if name == 'EXDATE':
+                properties.setdefault(name, []).extend(
+                    (parameters, v) for v in value.split(','))
+            else:
+                properties[name] = (parameters, value)
+    return result
+
+
+def read_chunks(files, chunk_size):
+    """
+    Yield the lines of the files by chunks of chunk_size VEVENT components.
+    The files are paths or text files.
+    """
+    chunk, count, depth = [], 0, 0
+    for file in files:
+        if isinstance(file, (str, os.PathLike)):
+            file = open(file, encoding='utf-8', newline='')
+            close = True
+        else:
+            close = False
+        try:
+            for line in file:
+                if depth:
+                    chunk.append(line)
+                    if line.startswith('BEGIN:'):
+                        depth += 1
+                    elif line.startswith('END:'):
+                        depth -= 1
+                        if not depth:
+                            count += 1
+                            if count >= chunk_size:
+                                yield chunk
+                                chunk, count = [], 0
+                elif line.rstrip('\r\n').upper() == 'BEGIN:VEVENT':
+                    chunk.append(line)
+                    depth = 1
+        finally:
+            if close:
+                file.close()
+    if chunk:
+        yield chunk
+
+
+def parse_chunks(chunks, processes=None):
+    """
+    Yield the parsed events of the chunks in order.
+    The chunks are parsed in this process unless processes is greater than
+    one, then they are parsed by a pool of processes with only a few chunks
+    pending at a time.
+    """
+    if not processes or processes <= 1:
+        for chunk in chunks:
+            yield parse_events(chunk)
+        return
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(parse_events, chunk))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_ics(store, files, batch_size=1000, processes=None, progress=None):
+    """
+    Add the events of the iCalendar files to the store by batches and return
+    the number of imported events.
+    """
+    if isinstance(files, (str, os.PathLike)) or hasattr(files, 'read'):
+        files = [files]
+    masters = {}
+    # The recurrence ids of the masters not yet read
+    overridden = collections.defaultdict(set)
+    count = 0
+    batch = []
+
+    def flush():
+        nonlocal batch, count
+        with store.batch():
+            store.add_events(batch)
+        count += len(batch)
+        batch = []
+        if progress is not None:
+            progress(count)
+
+    chunks = read_chunks(files, batch_size)
+    for records in parse_chunks(chunks, processes):
+        for uid, recurrence_id, record in records:
+            if recurrence_id is not None:
+                master = masters.get(uid)
+                if master is None:
+                    overridden[uid].add(recurrence_id)
+                elif recurrence_id not in master.exceptions:
+                    master.exceptions = master.exceptions | {recurrence_id}
+            if record is None:
+                continue
+            if 'freq' in record:
+                record['exceptions'] += overridden.pop(uid, ())
+                event = RecurringEvent(**record)
+                if uid is not None:
+                    masters[uid] = event
+            else:
+                event = Event(**record)
+            batch.append(event)
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+    return count
+
+
+def export_ics(store, fileobj, start=None, end=None):
+    """
+    Write the events of the store in the range to the text file as they are
+    generated in time order and return their number.
+    """
+    base = uuid.uuid4().hex
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime(
+        '%Y%m%dT%H%M%SZ')
+    fileobj.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\n'
+        'PRODID:-//GooCalendar//GooCalendar//EN\r\n')
+    count = 0
+    for count, event in enumerate(store.iter_events(start, end), 1):
+        fileobj.write(format_event(event, '%s-%d' % (base, count), stamp))
+    fileobj.write('END:VCALENDAR\r\n')
+    return count
@@ -0,0 +1,325 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import bisect
+import heapq
+
+from . import util
+
+
+class IntervalIndex(object):
+    """
+    This class indexes integer intervals to answer intersection queries.
+
+    Intervals are binned by the bit length of their duration and each bin is
+    kept sorted by start. A query only has to look, in each bin, at the
+    intervals starting less than the bin's maximal duration before it.
+
+    The bins are shared with the copies returned by share and copied only
+    when they are changed.
+    """
+
+    def __init__(self):
+        self._bins = {}
+        self._entries = {}
+        self._shared = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _bin(self, level):
+        "Return the bin of the level which can be changed"
+        bin_ = self._bins.get(level)
+        if bin_ is None:
+            bin_ = self._bins[level] = []
+        elif level in self._shared:
+            bin_ = self._bins[level] = list(bin_)
+            self._shared.discard(level)
+        return bin_
+
+    def add(self, key, start, end):
+        assert key not in self._entries
+        end = max(start, end)
+        entry = (start, end, key)
+        level = (end - start).bit_length()
+        bisect.insort(self._bin(level), entry)
+        self._entries[key] = entry
+
+    def add_many(self, intervals):
+        """
+        Add the intervals given as (key, start, end). The new entries of each
+        bin are sorted once and merged with the bin.
+        """
+        groups = {}
+        for key, start, end in intervals:
+            assert key not in self._entries
+            end = max(start, end)
+            entry = (start, end, key)
+            groups.setdefault((end - start).bit_length(), []).append(entry)
+            self._entries[key] = entry
+        for level, entries in groups.items():
+            bin_ = self._bin(level)
+            if len(entries) < 8:
+                for entry in entries:
+                    bisect.insort(bin_, entry)
+            else:
+                # Sorting two sorted runs merges them in linear time
+                entries.sort()
+                bin_.extend(entries)
+                bin_.sort()
+
+    def remove(self, key):
+        entry = self._entries.pop(key)
+        start, end, _ = entry
+        level = (end - start).bit_length()
+        bin_ = self._bin(level)
+        del bin_[bisect.bisect_left(bin_, entry)]
+        if not bin_:
+            del self._bins[level]
+
+    def clear(self):
+        self._bins = {}
+        self._entries.clear()
+        self._shared.clear()
+
+    def share(self):
+        """
+        Returns a read only copy of the index which supports only search,
+        iter_sorted and keys. It shares the bins until they are changed in
+        this index.
+        """
+        index = IntervalIndex.__new__(IntervalIndex)
+        index._bins = dict(self._bins)
+        index._entries = None
+        index._shared = None
+        self._shared.update(self._bins)
+        return index
+
+    def keys(self):
+        "Returns the sorted list of the keys"
+        return sorted(e[2] for bin_ in self._bins.values() for e in bin_)
+
+    def search(self, start, end):
+        """
+        Returns a list of the keys of all intervals which start before or at
+        end and finish after or at start.
+        """
+        keys = []
+        for level, bin_ in self._bins.items():
+            lo = bisect.bisect_left(bin_, (start - (1 << level) + 1,))
+            hi = bisect.bisect_left(bin_, (end + 1,), lo)
+            for entry in bin_[lo:hi]:
+                if entry[1] >= start:
+                    keys.append(entry[2])
+        return keys
+
+    def iter_sorted(self, start, end):
+        """
+        Yield the keys of all intervals which start before or at end and
+        finish after or at start sorted by start and end.
+        The bins are merged so only one entry of each bin is held at a time.
+        """
+        def entries(level, bin_):
+            lo = bisect.bisect_left(bin_, (start - (1 << level) + 1,))
+            hi = bisect.bisect_left(bin_, (end + 1,), lo)
+            for i in range(lo, hi):
+                entry = bin_[i]
+                if entry[1] >= start:
+                    yield entry
+        for _, _, key in heapq.merge(*(entries(level, bin_)
+                    for level, bin_ in self._bins.items())):
+            yield key
+
+
+class TokenIndex(object):
+    """
+    This class indexes the words of texts to find the keys of the texts
+    containing words starting with the words of a query.
+
+    The tokens are kept sorted so the tokens with a prefix are found by
+    bisection.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._tokens = []
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, text):
+        assert key not in self._entries
+        tokens = frozenset(util.tokenize(text))
+        for token in tokens:
+            if token not in self._keys:
+                self._keys[token] = set()
+                bisect.insort(self._tokens, token)
+            self._keys[token].add(key)
+        self._entries[key] = tokens
+
+    def remove(self, key):
+        for token in self._entries.pop(key):
+            keys = self._keys[token]
+            keys.discard(key)
+            if not keys:
+                del self._keys[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def update(self, key, text):
+        "Index the new text of the key if it changed"
+        if key in self._entries:
+            if self._entries[key] == frozenset(util.tokenize(text)):
+                return
+            self.remove(key)
+        self.add(key, text)
+
+    def clear(self):
+        self._keys.clear()
+        del self._tokens[:]
+        self._entries.clear()
+
+    def search(self, text):
+        """
+        Returns the set of the keys of the texts which have, for each word of
+        text, a word starting with it.
+        """
+        result = None
+        for token in set(util.tokenize(text)):
+            keys = set()
+            i = bisect.bisect_left(self._tokens, token)
+            while (i < len(self._tokens)
+                    and self._tokens[i].startswith(token)):
+                keys.update(self._keys[self._tokens[i]])
+                i += 1
+            result = keys if result is None else result & keys
+            if not result:
+                break
+        return result or set()
+
+
+# Larger than the day number of datetime.date.max
+FENWICK_SIZE = 1 << 22
+
+
+def _fenwick_add(tree, index, value):
+    while index < FENWICK_SIZE:
+        total = tree.get(index, 0) + value
+        if total:
+            tree[index] = total
+        else:
+            tree.pop(index, None)
+        index += index & -index
+
+
+def _fenwick_sum(tree, index):
+    "Return the sum of the values up to the index"
+    total = 0
+    while index > 0:
+        total += tree.get(index, 0)
+        index -= index & -index
+    return total
+
+
+class DayIndex(object):
+    """
+    This class keeps the number of integer intervals and their duration by
+    day to aggregate them over ranges of days.
+
+    The intervals are also counted by first and last day in Fenwick trees
+    so the number of intervals intersecting a range is the number starting
+    before its end minus the number ending before its start.
+    """
+
+    def __init__(self, intervals=()):
+        self._entries = {}
+        self._firsts = {}
+        self._lasts = {}
+        self._first_sums = {}
+        self._last_sums = {}
+        self._durations = {}
+        # The trees are built once from the counts of all the days
+        for key, start, end in intervals:
+            assert key not in self._entries
+            end = max(start, end)
+            self._entries[key] = (start, end)
+            self._change(start, end, 1, trees=False)
+        for counts, sums in [
+                (self._firsts, self._first_sums),
+                (self._lasts, self._last_sums),
+                ]:
+            for day, count in counts.items():
+                _fenwick_add(sums, day, count)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _change(self, start, end, sign, trees=True):
+        first = start // util.DAY_KEY
+        last = (end - 1) // util.DAY_KEY if end > start else first
+        for counts, sums, day in [
+                (self._firsts, self._first_sums, first),
+                (self._lasts, self._last_sums, last),
+                ]:
+            counts[day] = counts.get(day, 0) + sign
+            if not counts[day]:
+                del counts[day]
+            if trees:
+                _fenwick_add(sums, day, sign)
+        for day in range(first, last + 1):
+            duration = (min(end, (day + 1) * util.DAY_KEY)
+                - max(start, day * util.DAY_KEY))
+            if duration > 0:
+                duration = self._durations.get(day, 0) + sign * duration
+                if duration:
+                    self._durations[day] = duration
+                else:
+                    del self._durations[day]
+
+    def add(self, key, start, end):
+        assert key not in self._entries
+        end = max(start, end)
+        self._entries[key] = (start, end)
+        self._change(start, end, 1)
+
+    def remove(self, key):
+        self._change(*self._entries.pop(key), -1)
+
+    def update(self, key, start, end):
+        "Index the new interval of the key if it changed"
+        if key in self._entries:
+            if self._entries[key] == (start, max(start, end)):
+                return
+            self.remove(key)
+        self.add(key, start, end)
+
+    def clear(self):
+        self._entries.clear()
+        for values in [self._firsts, self._lasts, self._first_sums,
+                self._last_sums, self._durations]:
+            values.clear()
+
+    def count(self, first, last):
+        "Returns the number of intervals intersecting the days"
+        return (_fenwick_sum(self._first_sums, last)
+            - _fenwick_sum(self._last_sums, first - 1))
+
+    def days(self, first, last):
+        """
+        Yield for each day from first to last, the day, the number of
+        intervals intersecting it and their duration in it.
+        """
+        started = _fenwick_sum(self._first_sums, first - 1)
+        ended = _fenwick_sum(self._last_sums, first - 1)
+        for day in range(first, last + 1):
+            started += self._firsts.get(day, 0)
+            yield day, started - ended, self._durations.get(day, 0)
+            ended += self._lasts.get(day, 0)
@@ -0,0 +1,257 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import asyncio
+import collections
+import datetime
+import functools
+
+from gi.repository import GLib
+
+from ._event import EventStore
+
+
+def event_key(event):
+    return (event.caption, event.start, event.end)
+
+
+class LazyEventStore(EventStore):
+    """
+    This class is an event store which fetches the events from a provider
+    by pages of time only when they are requested.
+    """
+
+    def __init__(self, provider, page_size=datetime.timedelta(days=7),
+            max_pages=32, key=event_key):
+        super(LazyEventStore, self).__init__()
+        self.provider = provider
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.key = key
+        self._pages = collections.OrderedDict()
+        self._current_pages = set()
+        self._page_refs = {}
+        self._keys = {}
+        self._key_ids = {}
+        self._prefetch_pages = []
+        self._prefetch_id = None
+
+    def _page(self, value):
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, datetime.time())
+        return (value.replace(tzinfo=None) - datetime.datetime.min) \
+            // self.page_size
+
+    def _page_range(self, page):
+        start = datetime.datetime.min + page * self.page_size
+        return start, start + self.page_size
+
+    def _get_pages(self, start, end):
+        return list(range(self._page(start), self._page(end) + 1))
+
+    def _add_page(self, page, events):
+        """
+        Insert the events fetched for the page which are not yet in the store
+        and return them.
+        """
+        keys, added, seen = [], [], set()
+        for event in events:
+            key = self.key(event)
+            if key in seen:
+                continue
+            seen.add(key)
+            keys.append(key)
+            if key not in self._key_ids:
+                added.append((key, event))
+        self._insert_many([event for _, event in added])
+        for key, event in added:
+            self._keys[event.id] = key
+            self._key_ids[key] = event.id
+        ids = [self._key_ids[key] for key in keys]
+        for id_ in ids:
+            self._page_refs[id_] = self._page_refs.get(id_, 0) + 1
+        self._pages[page] = ids
+        added = [event for _, event in added]
+        self._track(added)
+        return added
+
+    def _fetch_page(self, page):
+        self._add_page(page, self.provider(*self._page_range(page)))
+
+    def _unload_page(self, page):
+        for id_ in self._pages.pop(page):
+            if id_ not in self._page_refs:
+                continue
+            self._page_refs[id_] -= 1
+            if not self._page_refs[id_]:
+                del self._page_refs[id_]
+                del self._key_ids[self._keys.pop(id_)]
+                event = self._events[id_]
+                self._unlink(event)
+                self._untrack(event)
+                self._delete(event)
+
+    def _evict(self):
+        for page in list(self._pages):
+            if len(self._pages) <= self.max_pages:
+                break
+            if page not in self._current_pages:
+                self._unload_page(page)
+
+    def _prefetch(self, start, end):
+        "Queue the loading of the pages before and after the given range"
+        span = end - start
+        pages = (self._get_pages(start - span, start)
+            + self._get_pages(end, end + span))
+        self._prefetch_pages = [p for p in pages if p not in self._pages]
+        if self._prefetch_pages and self._prefetch_id is None:
+            self._prefetch_id = GLib.idle_add(
+                self._prefetch_next, priority=GLib.PRIORITY_LOW)
+
+    def _prefetch_next(self):
+        while self._prefetch_pages:
+            page = self._prefetch_pages.pop(0)
+            if page not in self._pages:
+                self._fetch_page(page)
+                self._evict()
+                return True
+        self._prefetch_id = None
+        return False
+
+    def _forget(self, event):
+        self._page_refs.pop(event.id, None)
+        key = self._keys.pop(event.id, None)
+        if key is not None:
+            del self._key_ids[key]
+
+    def remove(self, event):
+        if event.id is not None:
+            self._forget(event)
+        super(LazyEventStore, self).remove(event)
+
+    def update_event(self, event, **changes):
+        super(LazyEventStore, self).update_event(event, **changes)
+        key = self._keys.get(event.id)
+        if key is not None:
+            del self._key_ids[key]
+            key = self._keys[event.id] = self.key(event)
+            self._key_ids[key] = event.id
+
+    def clear(self):
+        """
+        Remove all events and forget the fetched pages so they are fetched
+        again when requested.
+        """
+        self._pages.clear()
+        self._current_pages.clear()
+        self._page_refs.clear()
+        self._keys.clear()
+        self._key_ids.clear()
+        self._prefetch_pages = []
+        super(LazyEventStore, self).clear()
+
+    def _day_indexes(self, first, last):
+        # Fetch the pages of the days
+        self.get_events(datetime.datetime.fromordinal(first),
+            datetime.datetime.fromordinal(last + 1))
+        return super(LazyEventStore, self)._day_indexes(first, last)
+
+    def get_events(self, start=None, end=None, where=None):
+        """
+        Returns a list of all events that intersect with the given start
+        and end times. The missing pages are fetched from the provider and
+        the neighbouring pages are prefetched when idle.
+        If no start nor end are given, only the fetched events are returned.
+        """
+        if not start and not end:
+            return super(LazyEventStore, self).get_events(start, end, where)
+        range_end = end if end else start
+        pages = self._get_pages(start, range_end)
+        self._current_pages = set(pages)
+        for page in pages:
+            if page in self._pages:
+                self._pages.move_to_end(page)
+            else:
+                self._fetch_page(page)
+        self._evict()
+        self._prefetch(start, range_end)
+        return super(LazyEventStore, self).get_events(start, end, where)
+
+
+class AsyncEventStore(LazyEventStore):
+    """
+    This class is a lazy event store which fetches the pages of events
+    asynchronously from a provider on an asyncio event loop.
+    """
+
+    def __init__(self, provider, page_size=datetime.timedelta(days=7),
+            max_pages=32, key=event_key, loop=None):
+        super(AsyncEventStore, self).__init__(provider, page_size=page_size,
+            max_pages=max_pages, key=key)
+        # Without loop, the running loop of the first request is used
+        self.loop = loop
+        self._tasks = {}
+        self._fetched = []
+        self._flush_handle = None
+
+    def _fetch_page(self, page):
+        if page in self._tasks:
+            return
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        task = self.loop.create_task(
+            self.provider.fetch(*self._page_range(page)))
+        task.add_done_callback(functools.partial(self._page_fetched, page))
+        self._tasks[page] = task
+
+    def _page_fetched(self, page, task):
+        # The request may have finished before being cancelled
+        if self._tasks.get(page) is not task:
+            return
+        del self._tasks[page]
+        if task.cancelled():
+            return
+        self._fetched.append((page, task.result()))
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        "Insert the fetched pages and emit them in a single signal"
+        self._flush_handle = None
+        fetched, self._fetched = self._fetched, []
+        added = []
+        for page, events in fetched:
+            if page not in self._pages:
+                added.extend(self._add_page(page, events))
+        self._evict()
+        if added:
+            self._notify_added(added)
+
+    def _prefetch(self, start, end):
+        """
+        Fetch the pages before and after the given range and cancel the
+        requests of the other pages.
+        """
+        span = end - start
+        pages = (self._get_pages(start - span, start)
+            + self._get_pages(end, end + span))
+        wanted = self._current_pages.union(pages)
+        for page, task in list(self._tasks.items()):
+            if page not in wanted:
+                del self._tasks[page]
+                task.cancel()
+        # The pages fetched but not yet inserted may be no more wanted
+        self._fetched = [(p, e) for p, e in self._fetched if p in wanted]
+        for page in pages:
+            if page not in self._pages:
+                self._fetch_page(page)
+
+    def clear(self):
+        """
+        Remove all events, cancel the pending requests and forget the fetched
+        pages so they are fetched again when requested.
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._fetched = []
+        super(AsyncEventStore, self).clear()
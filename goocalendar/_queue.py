@@ -0,0 +1,93 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import collections
+import logging
+import threading
+import time
+
+from gi.repository import GLib
+
+logger = logging.getLogger(__name__)
+
+
+class EventQueue(object):
+    """
+    This class is a queue of changes to an event store which can be filled
+    from any thread and is applied on the GLib main loop when idle.
+    """
+
+    def __init__(self, store, time_slice=0.01, chunk_size=256,
+            priority=GLib.PRIORITY_DEFAULT_IDLE):
+        self.store = store
+        self.time_slice = time_slice
+        self.chunk_size = chunk_size
+        self.priority = priority
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._source = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _put(self, item):
+        with self._lock:
+            self._pending.append(item)
+            if self._source is None:
+                self._source = GLib.idle_add(
+                    self._drain, priority=self.priority)
+
+    def add_events(self, events):
+        "Queue the addition of the events"
+        events = list(events)
+        for i in range(0, len(events), self.chunk_size):
+            self._put((self.store.add_events,
+                    (events[i:i + self.chunk_size],)))
+
+    def remove_events(self, events):
+        "Queue the removal of the events"
+        self._put((self.store.remove_events, (list(events),)))
+
+    def apply_delta(self, upserts, deletions=()):
+        "Queue a change set for EventStore.apply_delta"
+        self._put((self.store.apply_delta, (dict(upserts), list(deletions))))
+
+    def _apply(self, deadline=None):
+        """
+        Apply the pending changes until the deadline in a single batch.
+        The changes which fail are logged and skipped.
+        """
+        with self.store.batch():
+            while self._pending:
+                func, args = self._pending.popleft()
+                try:
+                    func(*args)
+                except Exception:
+                    logger.exception("Failed to apply %s", func.__name__)
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+
+    def _drain(self):
+        applied = False
+        try:
+            self._apply(time.monotonic() + self.time_slice)
+            applied = True
+        finally:
+            with self._lock:
+                more = bool(self._pending)
+                if not applied:
+                    # The source is removed when the store raises
+                    self._source = None
+                    if more:
+                        self._source = GLib.idle_add(
+                            self._drain, priority=self.priority)
+                elif not more:
+                    self._source = None
+        return more
+
+    def flush(self):
+        "Apply all the pending changes now, from the main thread"
+        with self._lock:
+            if self._source is not None:
+                GLib.source_remove(self._source)
+                self._source = None
+        self._apply()
@@ -0,0 +1,283 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import array
+import bisect
+import datetime
+import heapq
+import json
+import mmap
+import struct
+import sys
+import weakref
+
+from . import util
+from ._columnar import (
+    ALL_DAY, EDITABLE, END_DATE, END_UTC, HAS_END, START_DATE, START_UTC,
+    is_aware)
+from ._event import Event, EventSnapshot, EventStore, RecurringEvent
+from ._sqlite import format_datetime, parse_datetime
+
+MAGIC = b'GOOCAL\x00\x01'
+# magic, count, bins, strings size, metadata size
+HEADER = struct.Struct('<8s4Q')
+
+
+def _padding(size):
+    return b'\x00' * (-size % 8)
+
+
+def write_snapshot(path, events):
+    """
+    Write the events in a snapshot file.
+    The records are grouped in bins by the bit length of their duration and
+    sorted by start in each bin like in the IntervalIndex.
+    """
+    records, recurring = [], []
+    for event in events:
+        if isinstance(event, RecurringEvent):
+            recurring.append(event)
+            continue
+        start, end = util.event_keys(event)
+        end = max(start, end)
+        records.append(((end - start).bit_length(), start, end, event))
+    records.sort(key=lambda r: r[:3])
+
+    bins, styles, style_ids = [], [], {}
+    starts, ends = array.array('q'), array.array('q')
+    offsets, ids, flags = array.array('q', [0]), array.array('I'), []
+    captions = bytearray()
+    for i, (level, start, end, event) in enumerate(records):
+        if not bins or bins[-1][0] != level:
+            bins.append([level, i, 0])
+        bins[-1][2] += 1
+        starts.append(start)
+        ends.append(end)
+        captions += event.caption.encode('utf-8')
+        offsets.append(len(captions))
+        style = (event.text_color, event.bg_color)
+        if style not in style_ids:
+            style_ids[style] = len(styles)
+            styles.append(style)
+        ids.append(style_ids[style])
+        flag = HAS_END if event.end is not None else 0
+        if event.all_day:
+            flag |= ALL_DAY
+        if event.editable:
+            flag |= EDITABLE
+        if not isinstance(event.start, datetime.datetime):
+            flag |= START_DATE
+        if (event.end is not None
+                and not isinstance(event.end, datetime.datetime)):
+            flag |= END_DATE
+        if is_aware(event.start):
+            flag |= START_UTC
+        if is_aware(event.end):
+            flag |= END_UTC
+        flags.append(flag)
+
+    metadata = json.dumps({
+            'byteorder': sys.byteorder,
+            'styles': styles,
+            'recurring': [{
+                    'caption': e.caption,
+                    'start': format_datetime(e.start),
+                    'end': format_datetime(e.end),
+                    'all_day': e.all_day,
+                    'editable': e.editable,
+                    'text_color': e.text_color,
+                    'bg_color': e.bg_color,
+                    'freq': e.freq,
+                    'interval': e.interval,
+                    'count': e.count,
+                    'until': format_datetime(e.until),
+                    'exceptions': [format_datetime(d) for d in e.exceptions],
+                    } for e in recurring],
+            }).encode('utf-8')
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(
+                MAGIC, len(records), len(bins), len(captions), len(metadata)))
+        file.write(array.array('q', [v for b in bins for v in b]).tobytes())
+        for column in [starts, ends, offsets, ids, bytes(flags)]:
+            data = bytes(column)
+            file.write(data)
+            file.write(_padding(len(data)))
+        file.write(captions)
+        file.write(_padding(len(captions)))
+        file.write(metadata)
+
+
+class SnapshotEventStore(EventStore):
+    """
+    This class is an event store which reads its events from a memory-mapped
+    snapshot file and decodes them only when they are queried.
+    The added and changed events are kept in memory.
+    """
+
+    def __init__(self, path):
+        super(SnapshotEventStore, self).__init__()
+        self._decoded = weakref.WeakValueDictionary()
+        self._shadowed = set()
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        magic, count, n_bins, captions_size, metadata_size = \
+            HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("%s is not an event snapshot" % path)
+        metadata = json.loads(bytes(buffer[-metadata_size:]))
+        if metadata['byteorder'] != sys.byteorder:
+            raise ValueError("%s has a different byte order" % path)
+
+        def section(size, format=None):
+            nonlocal offset
+            view = buffer[offset:offset + size]
+            offset += size + (-size % 8)
+            return view.cast(format) if format else view
+        offset = HEADER.size
+        bins = section(n_bins * 3 * 8, 'q')
+        self._bins = [tuple(bins[i:i + 3]) for i in range(0, len(bins), 3)]
+        bins.release()
+        self._starts = section(count * 8, 'q')
+        self._ends = section(count * 8, 'q')
+        self._offsets = section((count + 1) * 8, 'q')
+        self._style_ids = section(count * 4, 'I')
+        self._flags = section(count)
+        self._captions = section(captions_size)
+        self._buffer = buffer
+        self._count = count
+        self._next_event_id = count
+        self._styles = [tuple(s) for s in metadata['styles']]
+        self.add_events([RecurringEvent(r['caption'],
+                    parse_datetime(r['start']), parse_datetime(r['end']),
+                    freq=r['freq'], interval=r['interval'],
+                    count=r['count'], until=parse_datetime(r['until']),
+                    exceptions=map(parse_datetime, r['exceptions']),
+                    all_day=r['all_day'], editable=r['editable'],
+                    text_color=r['text_color'], bg_color=r['bg_color'])
+                for r in metadata['recurring']])
+
+    def close(self):
+        "Release the snapshot file"
+        if self._mmap is None:
+            return
+        for view in [self._starts, self._ends, self._offsets,
+                self._style_ids, self._flags, self._captions, self._buffer]:
+            view.release()
+        self._mmap.close()
+        self._mmap = None
+        self._count = 0
+        self._bins = []
+
+    def _get_event(self, row):
+        "Return the event of the record reusing the one in memory if any"
+        event = self._events.get(row)
+        if event is None:
+            event = self._decoded.get(row)
+        if event is None:
+            flags = self._flags[row]
+            start = util.key_datetime(self._starts[row])
+            if flags & START_DATE:
+                start = start.date()
+            elif flags & START_UTC:
+                start = start.replace(tzinfo=datetime.timezone.utc)
+            end = None
+            if flags & HAS_END:
+                end = util.key_datetime(self._ends[row])
+                if flags & END_DATE:
+                    end = end.date()
+                elif flags & END_UTC:
+                    end = end.replace(tzinfo=datetime.timezone.utc)
+            caption = str(
+                self._captions[self._offsets[row]:self._offsets[row + 1]],
+                'utf-8')
+            text_color, bg_color = self._styles[self._style_ids[row]]
+            event = Event(caption, start, end,
+                all_day=bool(flags & ALL_DAY), editable=bool(flags & EDITABLE),
+                text_color=text_color, bg_color=bg_color)
+            event.id = row
+            event._store = self
+            # The columns hold the keys of the event
+            event._keys = (self._starts[row], self._ends[row])
+            self._decoded[row] = event
+        return event
+
+    def _lookup(self, id_):
+        if id_ < 0:
+            return self._recurring[id_]
+        return self._get_event(id_)
+
+    def _delete(self, event):
+        if event.id in self._events:
+            super(SnapshotEventStore, self)._delete(event)
+        else:
+            event._store = None
+        if event.id < self._count:
+            self._shadowed.add(event.id)
+            self._decoded.pop(event.id, None)
+
+    def _reindex(self, event):
+        if event.id in self._events:
+            super(SnapshotEventStore, self)._reindex(event)
+        else:
+            # The changed record is moved in memory
+            self._shadowed.add(event.id)
+            self._decoded.pop(event.id, None)
+            self._events[event.id] = event
+            self._index.add(event.id, *util.event_keys(event))
+
+    def _reset(self):
+        for event in self._decoded.values():
+            event._store = None
+        self._decoded.clear()
+        self._shadowed.clear()
+        self.close()
+        super(SnapshotEventStore, self)._reset()
+
+    def snapshot(self):
+        "Returns an EventSnapshot of copies of the events"
+        return EventSnapshot.from_events(self)
+
+    def _search(self, start, end):
+        "Return the sorted records which intersect the keys"
+        rows = []
+        for level, offset, count in self._bins:
+            lo = bisect.bisect_left(self._starts, start - (1 << level) + 1,
+                offset, offset + count)
+            hi = bisect.bisect_right(self._starts, end, lo, offset + count)
+            rows.extend(row for row in range(lo, hi)
+                if self._ends[row] >= start)
+        rows.sort()
+        return rows
+
+    def _ordered(self, start, end):
+        def records(level, offset, count):
+            lo = bisect.bisect_left(self._starts, start - (1 << level) + 1,
+                offset, offset + count)
+            hi = bisect.bisect_right(self._starts, end, lo, offset + count)
+            for row in range(lo, hi):
+                if self._ends[row] >= start and row not in self._shadowed:
+                    yield self._starts[row], self._ends[row], row
+        rows = heapq.merge(*(records(*b) for b in self._bins))
+        return heapq.merge((self._get_event(row) for _, _, row in rows),
+            super(SnapshotEventStore, self)._ordered(start, end),
+            key=util.event_keys)
+
+    def _query(self, start, end):
+        everything = not start and not end
+        if everything:
+            rows = range(self._count)
+        else:
+            start_key, end_key = util.range_keys(start, end)
+            rows = self._search(start_key, end_key)
+        events = []
+        for row in rows:
+            if row in self._shadowed:
+                continue
+            event = self._get_event(row)
+            if everything or util.keys_intersect(
+                    *util.event_keys(event), start_key, end_key):
+                events.append(event)
+        changed = super(SnapshotEventStore, self)._query(start, end)
+        if everything:
+            changed.sort(key=lambda e: e.id)
+        return events + changed
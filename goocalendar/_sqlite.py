@@ -0,0 +1,302 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import contextlib
+import datetime
+import itertools
+import json
+import sqlite3
+import weakref
+
+from . import util
+from ._event import Event, EventSnapshot, EventStore, RecurringEvent
+
+EPOCH_KEY = util.datetime_key(datetime.datetime(1970, 1, 1))
+MINUTE = 60 * 1000000
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS event ('
+    'id INTEGER PRIMARY KEY, '
+    'caption TEXT NOT NULL, '
+    'start TEXT NOT NULL, '
+    '"end" TEXT, '
+    'all_day INTEGER NOT NULL, '
+    'editable INTEGER NOT NULL, '
+    'text_color TEXT, '
+    'bg_color TEXT, '
+    'external_id)',
+    'CREATE VIRTUAL TABLE IF NOT EXISTS event_index '
+    'USING rtree(id, start, "end")',
+    # The ids of the recurring events are negative like in the store
+    'CREATE TABLE IF NOT EXISTS recurrence ('
+    'id INTEGER PRIMARY KEY, '
+    'caption TEXT NOT NULL, '
+    'start TEXT NOT NULL, '
+    '"end" TEXT, '
+    'all_day INTEGER NOT NULL, '
+    'editable INTEGER NOT NULL, '
+    'text_color TEXT, '
+    'bg_color TEXT, '
+    'freq TEXT NOT NULL, '
+    'interval INTEGER NOT NULL, '
+    'count INTEGER, '
+    'until TEXT, '
+    'exceptions TEXT NOT NULL, '
+    'external_id)',
+    ]
+COLUMNS = ('caption', 'start', 'end', 'all_day', 'editable', 'text_color',
+    'bg_color')
+RECURRENCE_COLUMNS = COLUMNS + (
+    'freq', 'interval', 'count', 'until', 'exceptions')
+
+
+def minute_key(key):
+    "Return the minutes since the Unix epoch of a datetime_key"
+    return (key - EPOCH_KEY) // MINUTE
+
+
+def format_datetime(value):
+    if value is None:
+        return None
+    return value.isoformat()
+
+
+def parse_datetime(value):
+    if value is None:
+        return None
+    if 'T' in value:
+        return datetime.datetime.fromisoformat(value)
+    return datetime.date.fromisoformat(value)
+
+
+class SQLiteEventStore(EventStore):
+    """
+    This class is an event store which persists the events in a SQLite
+    database and queries them with an R*Tree index.
+    Only the events in use are kept in memory.
+    """
+
+    def __init__(self, path=':memory:'):
+        super(SQLiteEventStore, self).__init__()
+        self._connection = sqlite3.connect(path)
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+        for table in ['event', 'recurrence']:
+            # The databases created before the external ids lack the column
+            columns = [row[1] for row in self._connection.execute(
+                    'PRAGMA table_info(%s)' % table)]
+            if 'external_id' not in columns:
+                self._connection.execute(
+                    'ALTER TABLE %s ADD COLUMN external_id' % table)
+        self._connection.commit()
+        self._events = weakref.WeakValueDictionary()
+        self._load_recurring()
+        self._load_external_ids()
+
+    def close(self):
+        # Save the start and the end set on the events
+        self._connection.commit()
+        self._connection.close()
+
+    def _commit(self):
+        if not self._batch_level:
+            self._connection.commit()
+
+    def _values(self, event):
+        return (event.caption, format_datetime(event.start),
+            format_datetime(event.end), event.all_day, event.editable,
+            event.text_color, event.bg_color)
+
+    def _keys(self, event):
+        start, end = map(minute_key, util.event_keys(event))
+        return start, max(start, end)
+
+    def _insert(self, event):
+        assert event.id is None
+        cursor = self._connection.execute(
+            'INSERT INTO event (%s) VALUES (?, ?, ?, ?, ?, ?, ?)'
+            % ', '.join('"%s"' % c for c in COLUMNS), self._values(event))
+        event.id = cursor.lastrowid
+        self._connection.execute(
+            'INSERT INTO event_index (id, start, "end") VALUES (?, ?, ?)',
+            (event.id,) + self._keys(event))
+        self._events[event.id] = event
+        event._store = self
+
+    def _insert_many(self, events):
+        for event in events:
+            self._insert(event)
+
+    def _delete(self, event):
+        self._connection.execute(
+            'DELETE FROM event WHERE id = ?', (event.id,))
+        self._connection.execute(
+            'DELETE FROM event_index WHERE id = ?', (event.id,))
+        self._events.pop(event.id, None)
+        event._store = None
+        self._commit()
+
+    def _reindex(self, event):
+        self._connection.execute(
+            'UPDATE event SET %s WHERE id = ?'
+            % ', '.join('"%s" = ?' % c for c in COLUMNS),
+            self._values(event) + (event.id,))
+        self._connection.execute(
+            'UPDATE event_index SET start = ?, "end" = ? WHERE id = ?',
+            self._keys(event) + (event.id,))
+        # The start and the end are set on each motion of a drag so they are
+        # committed only by update_event, batch or close
+
+    def _recurrence_values(self, event):
+        return self._values(event) + (event.freq, event.interval,
+            event.count, format_datetime(event.until),
+            json.dumps(sorted(map(format_datetime, event.exceptions))))
+
+    def _load_recurring(self):
+        "Load the recurring events which are always kept in memory"
+        cursor = self._connection.execute(
+            'SELECT id, %s FROM recurrence ORDER BY id DESC'
+            % ', '.join('"%s"' % c for c in RECURRENCE_COLUMNS))
+        for row in cursor:
+            (id_, caption, start, end, all_day, editable, text_color,
+                bg_color, freq, interval, count, until, exceptions) = row
+            event = RecurringEvent(caption, parse_datetime(start),
+                parse_datetime(end), freq=freq, interval=interval,
+                count=count, until=parse_datetime(until),
+                exceptions=map(parse_datetime, json.loads(exceptions)),
+                all_day=bool(all_day), editable=bool(editable),
+                text_color=text_color, bg_color=bg_color)
+            event.id = id_
+            event._store = self
+            self._recurring[id_] = event
+            self._next_recurring_id = min(self._next_recurring_id, id_ - 1)
+
+    def _load_external_ids(self):
+        "Load the external keys of apply_delta"
+        cursor = self._connection.execute(
+            'SELECT id, external_id FROM event '
+            'WHERE external_id IS NOT NULL '
+            'UNION ALL SELECT id, external_id FROM recurrence '
+            'WHERE external_id IS NOT NULL')
+        for id_, key in cursor:
+            self._external_ids[key] = id_
+            self._external_keys[id_] = key
+
+    def _link(self, key, event):
+        super(SQLiteEventStore, self)._link(key, event)
+        self._connection.execute(
+            'UPDATE %s SET external_id = ? WHERE id = ?'
+            % ('recurrence' if event.id < 0 else 'event'), (key, event.id))
+        self._commit()
+
+    def _insert_recurring(self, event):
+        super(SQLiteEventStore, self)._insert_recurring(event)
+        self._connection.execute(
+            'INSERT INTO recurrence (id, %s) VALUES (?%s)'
+            % (', '.join('"%s"' % c for c in RECURRENCE_COLUMNS),
+                ', ?' * len(RECURRENCE_COLUMNS)),
+            (event.id,) + self._recurrence_values(event))
+
+    def _delete_recurring(self, event):
+        super(SQLiteEventStore, self)._delete_recurring(event)
+        self._connection.execute(
+            'DELETE FROM recurrence WHERE id = ?', (event.id,))
+        self._commit()
+
+    def _refresh(self, event):
+        super(SQLiteEventStore, self)._refresh(event)
+        if isinstance(event, RecurringEvent) and event.id in self._recurring:
+            self._connection.execute(
+                'UPDATE recurrence SET %s WHERE id = ?'
+                % ', '.join('"%s" = ?' % c for c in RECURRENCE_COLUMNS),
+                self._recurrence_values(event) + (event.id,))
+
+    def _reset(self):
+        for event in self._events.values():
+            event._store = None
+        self._events.clear()
+        self._connection.execute('DELETE FROM event')
+        self._connection.execute('DELETE FROM event_index')
+        self._connection.execute('DELETE FROM recurrence')
+        self._commit()
+
+    def _get_event(self, row):
+        "Return the event of the row reusing the one in memory if any"
+        id_ = row[0]
+        event = self._events.get(id_)
+        if event is None:
+            caption, start, end, all_day, editable, text_color, bg_color = \
+                row[1:]
+            event = Event(caption, parse_datetime(start), parse_datetime(end),
+                all_day=bool(all_day), editable=bool(editable),
+                text_color=text_color, bg_color=bg_color)
+            event.id = id_
+            event._store = self
+            self._events[id_] = event
+        return event
+
+    def _lookup(self, id_):
+        if id_ < 0:
+            return self._recurring[id_]
+        event = self._events.get(id_)
+        if event is None:
+            cursor = self._connection.execute(
+                'SELECT id, %s FROM event WHERE id = ?'
+                % ', '.join('"%s"' % c for c in COLUMNS), (id_,))
+            event = self._get_event(cursor.fetchone())
+        return event
+
+    def add_events(self, events):
+        super(SQLiteEventStore, self).add_events(events)
+        self._commit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Returns a context manager which collects the events added, removed and
+        changed within it in a single transaction and emits them in a single
+        events-changed signal on exit.
+        """
+        try:
+            with super(SQLiteEventStore, self).batch():
+                yield self
+        finally:
+            self._commit()
+
+    def update_event(self, event, **changes):
+        super(SQLiteEventStore, self).update_event(event, **changes)
+        self._commit()
+
+    def snapshot(self):
+        "Returns an EventSnapshot of copies of all the events read in memory"
+        return EventSnapshot.from_events(self)
+
+    def _ordered(self, start, end):
+        columns = ', '.join('e."%s"' % c for c in COLUMNS)
+        cursor = self._connection.execute(
+            'SELECT i.start, e.id, %s FROM event_index AS i '
+            'JOIN event AS e ON e.id = i.id '
+            'WHERE i.start <= ? AND i."end" >= ? ORDER BY i.start' % columns,
+            (minute_key(end), minute_key(start)))
+        # The index keys are rounded so the events are sorted by group
+        for _, rows in itertools.groupby(cursor, key=lambda r: r[0]):
+            yield from sorted((self._get_event(r[1:]) for r in rows),
+                key=util.event_keys)
+
+    def _query(self, start, end):
+        columns = ', '.join('e."%s"' % c for c in COLUMNS)
+        if not start and not end:
+            cursor = self._connection.execute(
+                'SELECT e.id, %s FROM event AS e ORDER BY e.id' % columns)
+            return [self._get_event(row) for row in cursor]
+        start, end = util.range_keys(start, end)
+        cursor = self._connection.execute(
+            'SELECT e.id, %s FROM event_index AS i '
+            'JOIN event AS e ON e.id = i.id '
+            'WHERE i.start <= ? AND i."end" >= ? ORDER BY e.id' % columns,
+            (minute_key(end), minute_key(start)))
+        events = []
+        for row in cursor:
+            event = self._get_event(row)
+            if util.keys_intersect(*util.event_keys(event), start, end):
+                events.append(event)
+        return events
@@ -0,0 +1,313 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""
+Tools to check that an event store follows the protocol used by the Calendar
+and to compare the performance of event stores.
+"""
+import datetime
+import random
+import time
+
+from . import util
+from ._event import Event, RecurringEvent
+
+START = datetime.datetime(2000, 1, 1)
+
+
+def generate_events(n, per_day=50, seed=0):
+    "Generate n random events with about per_day events each day."
+    rand = random.Random(seed)
+    minutes = max(n // per_day, 1) * 24 * 60
+    for i in range(n):
+        start = START + datetime.timedelta(
+            minutes=rand.randrange(0, minutes, 15))
+        if rand.random() < 0.1:
+            yield Event('Event %s' % i, start)
+        else:
+            duration = datetime.timedelta(
+                minutes=rand.choice([15, 30, 60, 120, 480, 3 * 24 * 60]))
+            yield Event('Event %s' % i, start, start + duration)
+
+
+def _keys(events):
+    return sorted((e.caption, e.start, e.end) for e in events)
+
+
+class EventStoreTestMixin(object):
+    """
+    A mixin for unittest.TestCase which checks that the store returned by
+    create_store follows the event store protocol.
+    The tests of the optional methods are skipped when the store does not
+    implement them.
+    """
+    size = 500
+
+    def create_store(self):
+        "Return a new empty event store"
+        raise NotImplementedError
+
+    def reopen_store(self, store):
+        """
+        Close the store and return a new store reading the same storage.
+        The persistence tests are skipped if it is not implemented.
+        """
+        raise NotImplementedError
+
+    def _store(self, events=()):
+        store = self.create_store()
+        if not hasattr(store, 'add_events'):
+            self.skipTest("add_events is not implemented")
+        store.add_events(list(events))
+        return store
+
+    def _require(self, store, name):
+        if not hasattr(store, name):
+            self.skipTest("%s is not implemented" % name)
+
+    def _ranges(self):
+        yield START, START + datetime.timedelta(days=1)
+        yield (START + datetime.timedelta(days=3, hours=7),
+            START + datetime.timedelta(days=3, hours=7, minutes=30))
+        yield START + datetime.timedelta(days=2), None
+        yield START - datetime.timedelta(days=7), START
+
+    def test_get_events_range(self):
+        "Test get_events returns the events intersecting the range"
+        events = list(generate_events(self.size, per_day=50))
+        store = self._store(events)
+        for start, end in self._ranges():
+            self.assertEqual(_keys(store.get_events(start, end)),
+                _keys(util.get_intersection_list(events, start, end)))
+
+    def test_get_events_all(self):
+        "Test get_events returns all the events without range"
+        events = list(generate_events(self.size))
+        store = self._store(events)
+        self.assertEqual(_keys(store.get_events()), _keys(events))
+
+    def test_add_signal(self):
+        "Test the store notifies the added events"
+        store = self._store()
+        notified = []
+        if hasattr(store, 'subscribe'):
+            store.subscribe(lambda a, r, c: notified.extend(a))
+        else:
+            store.connect('event-added',
+                lambda store, events: notified.extend(events))
+        events = list(generate_events(10))
+        store.add_events(events)
+        self.assertEqual(_keys(notified), _keys(events))
+
+    def test_remove(self):
+        "Test the removed events are no more returned"
+        store = self._store(generate_events(self.size))
+        self._require(store, 'remove_events')
+        events = store.get_events()
+        removed, kept = events[::2], events[1::2]
+        store.remove_events(removed)
+        self.assertEqual(_keys(store.get_events()), _keys(kept))
+        for start, end in self._ranges():
+            self.assertEqual(_keys(store.get_events(start, end)),
+                _keys(util.get_intersection_list(kept, start, end)))
+
+    def test_update_event(self):
+        "Test update_event moves the event in the range queries"
+        store = self._store(generate_events(self.size))
+        self._require(store, 'update_event')
+        event, = [e for e in store.get_events() if e.caption == 'Event 0']
+        start = START + datetime.timedelta(days=365)
+        end = start + datetime.timedelta(hours=1)
+        store.update_event(event, start=start, end=end)
+        self.assertEqual([e.caption for e in store.get_events(start, end)],
+            ['Event 0'])
+        self.assertEqual(_keys(e for e in store.get_events()
+                if e.caption == 'Event 0'),
+            [('Event 0', start, end)])
+
+    def test_batch(self):
+        "Test the changes of a batch are notified once"
+        store = self._store(generate_events(10))
+        self._require(store, 'batch')
+        self._require(store, 'subscribe')
+        notified = []
+        store.subscribe(lambda *args: notified.append(args))
+        events = list(generate_events(20, seed=1))
+        with store.batch():
+            store.add_events(events[:10])
+            store.add_events(events[10:])
+            store.remove_events(events[:5])
+        self.assertEqual(len(notified), 1)
+        added, removed, changed = notified[0]
+        self.assertEqual(_keys(added), _keys(events[5:]))
+        self.assertEqual(removed, [])
+
+    def test_subscribe_range(self):
+        "Test a subscription is notified only of the changes in its range"
+        store = self._store()
+        self._require(store, 'subscribe')
+        start = START + datetime.timedelta(days=1)
+        end = START + datetime.timedelta(days=2)
+        notified = []
+        subscription = store.subscribe(
+            lambda a, r, c: notified.extend(a), start, end)
+        inside = Event('Inside', start + datetime.timedelta(hours=1),
+            start + datetime.timedelta(hours=2))
+        outside = Event('Outside', end + datetime.timedelta(hours=1),
+            end + datetime.timedelta(hours=2))
+        store.add_events([inside, outside])
+        self.assertEqual(_keys(notified), _keys([inside]))
+        subscription.cancel()
+        store.add_events([Event('Later', start)])
+        self.assertEqual(_keys(notified), _keys([inside]))
+
+    def test_clear(self):
+        "Test clear removes all the events"
+        store = self._store(generate_events(self.size))
+        self._require(store, 'clear')
+        store.clear()
+        self.assertEqual(list(store.get_events()), [])
+        self.assertEqual(list(store.get_events(START, None)), [])
+
+    def test_version(self):
+        "Test the version increases on changes"
+        store = self._store()
+        self._require(store, 'version')
+        version = store.version
+        store.add_events(list(generate_events(10)))
+        self.assertGreater(store.version, version)
+
+    def test_apply_delta(self):
+        "Test apply_delta upserts and deletes by external id"
+        store = self._store()
+        self._require(store, 'apply_delta')
+        store.apply_delta({
+                1: Event('One', START),
+                2: Event('Two', START),
+                })
+        store.apply_delta({1: Event('Uno', START)}, [2])
+        self.assertEqual([e.caption for e in store.get_events()], ['Uno'])
+
+    def test_search(self):
+        "Test search finds the events by the words of the caption"
+        events = list(generate_events(self.size))
+        store = self._store(events)
+        self._require(store, 'search')
+        tokens = util.tokenize('event 42')
+        self.assertEqual(_keys(store.search('event 42')),
+            _keys(e for e in events if util.match_tokens(e.caption, tokens)))
+
+    def test_iter_events(self):
+        "Test iter_events generates the events of the range sorted by time"
+        events = list(generate_events(self.size))
+        store = self._store(events)
+        self._require(store, 'iter_events')
+        for start, end in self._ranges():
+            result = list(store.iter_events(start, end))
+            self.assertEqual([util.event_keys(e) for e in result],
+                sorted(util.event_keys(e) for e in result))
+            start_key, end_key = util.bound_keys(start, end)
+            self.assertEqual(_keys(result), _keys(e for e in events
+                    if util.keys_intersect(
+                        *util.event_keys(e), start_key, end_key)))
+
+    def test_reopen(self):
+        "Test the events and the recurring events are kept on reopening"
+        events = list(generate_events(self.size))
+        store = self._store(events)
+        self._require(store, 'update_event')
+        recurring = RecurringEvent('Weekly', START + datetime.timedelta(
+                hours=9), START + datetime.timedelta(hours=10), count=10,
+            exceptions=[START + datetime.timedelta(weeks=1, hours=9)])
+        removed = RecurringEvent('Daily', START, freq='daily')
+        store.add_events([recurring, removed])
+        store.update_event(recurring, interval=2, caption='Biweekly')
+        store.remove(removed)
+        try:
+            store = self.reopen_store(store)
+        except NotImplementedError:
+            self.skipTest("reopen_store is not implemented")
+        self.assertEqual(_keys(store.get_events()),
+            _keys(events + [recurring]))
+        reopened, = [e for e in store.get_events()
+            if isinstance(e, RecurringEvent)]
+        self.assertEqual(
+            [getattr(reopened, f) for f in RecurringEvent.FIELDS],
+            [getattr(recurring, f) for f in RecurringEvent.FIELDS])
+        start, end = START, START + datetime.timedelta(weeks=20)
+        self.assertEqual(
+            [e.start for e in store.get_events(start, end)
+                if e.caption == 'Biweekly'],
+            [START + datetime.timedelta(weeks=n, hours=9)
+                for n in range(0, 20, 2)])
+
+    def test_where(self):
+        "Test get_events filters on the attributes"
+        events = list(generate_events(self.size))
+        for i, event in enumerate(events):
+            event.all_day = not i % 3
+        store = self._store(events)
+        start, end = START, START + datetime.timedelta(days=5)
+        try:
+            result = store.get_events(start, end, where={'all_day': True})
+        except TypeError:
+            self.skipTest("get_events does not support where")
+        self.assertEqual(_keys(result), _keys(e
+                for e in util.get_intersection_list(events, start, end)
+                if e.all_day))
+
+
+def benchmark(factories, sizes=(10000, 100000), per_day=50, number=100):
+    """
+    Run the same workloads on the stores created by the factories, a
+    dictionary of callables by name, and return the seconds per operation by
+    name, size and workload:
+
+    - add: add all the events
+    - page: query a six weeks page
+    - update: move an event
+    - remove: remove an event
+    """
+    results = {}
+    rand = random.Random(0)
+    for size in sizes:
+        days = max(size // per_day, 1)
+        pages = [START + datetime.timedelta(days=rand.randrange(days))
+            for _ in range(number)]
+        for name, factory in factories.items():
+            store = factory()
+            events = list(generate_events(size, per_day=per_day))
+            timings = results[name, size] = {}
+
+            begin = time.perf_counter()
+            store.add_events(events)
+            timings['add'] = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            for start in pages:
+                store.get_events(start, start + datetime.timedelta(weeks=6))
+            timings['page'] = (time.perf_counter() - begin) / number
+
+            events = rand.sample(list(store.get_events()), number)
+            if hasattr(store, 'update_event'):
+                begin = time.perf_counter()
+                for event, start in zip(events, pages):
+                    store.update_event(event, start=start, end=None)
+                timings['update'] = (time.perf_counter() - begin) / number
+            if hasattr(store, 'remove'):
+                begin = time.perf_counter()
+                for event in events:
+                    store.remove(event)
+                timings['remove'] = (time.perf_counter() - begin) / number
+    return results
+
+
+def print_benchmark(results):
+    "Print the results of benchmark in milliseconds"
+    workloads = ['add', 'page', 'update', 'remove']
+    print(("%-20s %10s" + " %12s" * len(workloads)) % (
+            ("store", "events") + tuple(workloads)))
+    for (name, size), timings in results.items():
+        print(("%-20s %10d" + " %12s" * len(workloads)) % (
+                (name, size) + tuple(
+                    '%.3f' % (timings[w] * 1000) if w in timings else '-'
+                    for w in workloads)))
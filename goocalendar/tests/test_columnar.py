@@ -0,0 +1,74 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from goocalendar import ColumnarEventStore, Event
+
+from . import test_event
+
+START = datetime.datetime(2000, 1, 1)
+HOUR = datetime.timedelta(hours=1)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class ColumnarEventStoreTestCase(test_event.EventStoreTestCase):
+    "Test ColumnarEventStore"
+
+    def create_store(self):
+        return ColumnarEventStore()
+
+    def test_zero_capacity(self):
+        "Test a store without capacity grows"
+        store = ColumnarEventStore(capacity=0)
+        store.add(Event('Event', START))
+        self.assertEqual([e.caption for e in store.get_events()], ['Event'])
+
+    def test_reuse_rows(self):
+        "Test the rows of the removed events are reused"
+        store = ColumnarEventStore(capacity=4)
+        for i in range(10):
+            event = Event('Event %s' % i, START + i * HOUR)
+            store.add(event)
+            store.remove(event)
+        store.add_arrays(['Array'], [START], [START + HOUR])
+        store.add(Event('Kept', START + HOUR))
+        self.assertLessEqual(store._size, 2)
+        self.assertEqual(sorted(e.caption for e in store.get_events()),
+            ['Array', 'Kept'])
+
+    def test_add_arrays_reuse_rows(self):
+        "Test add_arrays fills the free rows before appending"
+        store = ColumnarEventStore()
+        events = [Event('Event %s' % i, START + i * HOUR) for i in range(3)]
+        store.add_events(events)
+        store.remove(events[1])
+        captions = ['A', 'B', 'C']
+        starts = [START + i * HOUR for i in range(3)]
+        store.add_arrays(captions, starts, [s + HOUR for s in starts])
+        self.assertEqual(store._size, 5)
+        self.assertEqual(
+            sorted((e.caption, e.start) for e in store.get_events()),
+            sorted([('Event 0', START), ('Event 2', START + 2 * HOUR)]
+                + list(zip(captions, starts))))
+
+    def test_aware_datetimes(self):
+        "Test the aware datetimes are read in UTC"
+        super().test_aware_datetimes()
+        paris = datetime.timezone(datetime.timedelta(hours=1))
+        start = datetime.datetime(2000, 1, 1, 10, tzinfo=paris)
+        store = ColumnarEventStore()
+        store.add_events([
+                Event('Aware', start, start + HOUR),
+                Event('Naive', start.replace(tzinfo=None)),
+                ])
+        # The events are read again from the columns
+        aware, naive = sorted(store.get_events(), key=lambda e: e.caption)
+        self.assertEqual((aware.start, aware.end), (start, start + HOUR))
+        self.assertEqual(aware.start.utcoffset(), datetime.timedelta())
+        self.assertEqual(naive.start, start.replace(tzinfo=None))
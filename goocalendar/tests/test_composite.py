@@ -0,0 +1,88 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import random
+
+from goocalendar import CompositeEventStore, Event, EventStore
+from goocalendar.testing import generate_events
+
+from . import test_event
+
+START = datetime.datetime(2000, 1, 1)
+DAY = datetime.timedelta(days=1)
+
+
+class CompositeEventStoreTestCase(test_event.EventStoreTestCase):
+    "Test CompositeEventStore"
+
+    def create_store(self):
+        return CompositeEventStore([EventStore(), EventStore()])
+
+    def setUp(self):
+        self.layer = EventStore()
+        self.layer.add_events([Event('Day %s' % i, START + i * DAY)
+                for i in range(30)])
+        self.store = CompositeEventStore([EventStore(), self.layer])
+        self.notified = []
+        self.store.connect('events-changed',
+            lambda store, added, removed, changed: self.notified.append(
+                (sorted(e.caption for e in added),
+                    sorted(e.caption for e in removed))))
+
+    def test_toggle_subscription_range(self):
+        "Test a toggled layer emits the events of the subscriptions"
+        self.store.subscribe(lambda *args: None, START, START + DAY)
+        # A wide query does not change the emitted events
+        self.store.get_events(START, START + 30 * DAY)
+        self.store.set_visible(self.layer, False)
+        self.assertEqual(self.notified, [([], ['Day 0', 'Day 1'])])
+
+    def test_toggle_set_range(self):
+        "Test a toggled layer emits the events of the range set"
+        self.store.subscribe(lambda *args: None, START, START + DAY)
+        self.store.set_range(START + 10 * DAY, START + 11 * DAY)
+        self.store.set_visible(self.layer, False)
+        self.store.set_visible(self.layer, True)
+        self.assertEqual(self.notified, [
+                ([], ['Day 10', 'Day 11']),
+                (['Day 10', 'Day 11'], []),
+                ])
+
+    def test_toggle_without_range(self):
+        "Test a toggled layer emits nothing without range nor subscription"
+        self.store.get_events(START, START + DAY)
+        self.store.set_visible(self.layer, False)
+        self.assertEqual(self.notified, [])
+
+    def test_toggle_layers(self):
+        "Test the events of the visible layers follow the toggles"
+        rand = random.Random(0)
+        layers = [EventStore() for _ in range(3)]
+        for i, layer in enumerate(layers):
+            layer.add_events(list(generate_events(100, per_day=10, seed=i)))
+        store = CompositeEventStore(layers)
+        start, end = START + DAY, START + 4 * DAY
+        subscribed = {id(e): e for e in store.get_events(start, end)}
+
+        def notify(added, removed, changed):
+            for event in removed:
+                del subscribed[id(event)]
+            for event in added:
+                subscribed[id(event)] = event
+        store.subscribe(notify, start, end)
+
+        def visible_events(start, end):
+            return [e for layer in layers if store.is_visible(layer)
+                for e in layer.get_events(start, end)]
+
+        for i in range(20):
+            layer = rand.choice(layers)
+            store.set_visible(layer, not store.is_visible(layer))
+            if rand.random() < 0.3:
+                layer.add_events(list(generate_events(
+                            10, per_day=5, seed=10 + i)))
+            for range_ in [(start, end), (START, START + DAY), (None, None)]:
+                self.assertCountEqual(map(id, store.get_events(*range_)),
+                    map(id, visible_events(*range_)))
+            self.assertCountEqual(subscribed,
+                map(id, visible_events(start, end)))
@@ -0,0 +1,339 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import collections
+import datetime
+import random
+import unittest
+
+from goocalendar import Event, EventStore, RecurringEvent, util
+from goocalendar.testing import EventStoreTestMixin, generate_events
+
+START = datetime.datetime(2000, 1, 1)
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+def captions(events):
+    return sorted(e.caption for e in events)
+
+
+def keys(events):
+    return sorted((e.caption, e.start, e.end) for e in events)
+
+
+class EventStoreTestCase(EventStoreTestMixin, unittest.TestCase):
+    "Test EventStore"
+
+    def create_store(self):
+        return EventStore()
+
+    def test_search_open_range(self):
+        "Test search with only a start or an end does not bound the range"
+        events = list(generate_events(self.size))
+        store = self.create_store()
+        store.add_events(events)
+        tokens = util.tokenize('event 1')
+        middle = START + datetime.timedelta(days=3)
+        for start, end in [(middle, None), (None, middle)]:
+            start_key, end_key = util.bound_keys(start, end)
+            self.assertEqual(captions(store.search('event 1', start, end)),
+                captions(e for e in events
+                    if util.match_tokens(e.caption, tokens)
+                    and util.keys_intersect(
+                        *util.event_keys(e), start_key, end_key)))
+
+    def test_remove_recurring_indexed(self):
+        "Test a recurring event removed after indexing is no more found"
+        store = self.create_store()
+        store.add_events(list(generate_events(10)))
+        recurring = RecurringEvent('Weekly', START, all_day=True)
+        store.add_events([recurring])
+        store.search('weekly')
+        store.get_events(START, None, where={'all_day': True})
+        store.remove(recurring)
+        self.assertEqual(list(store.search('weekly')), [])
+        self.assertEqual(
+            [e.caption for e in store.get_events(START, None,
+                    where={'all_day': True})
+                if e.caption == 'Weekly'], [])
+
+    def test_snapshot(self):
+        "Test a snapshot keeps the events of the store when it was taken"
+        rand = random.Random(0)
+        store = self.create_store()
+        store.add_events(list(generate_events(self.size)))
+        store.add(RecurringEvent('Daily', START, START + HOUR, freq='daily',
+                count=60))
+        ranges = list(self._ranges()) + [(None, None)]
+        expected = [keys(store.get_events(*r)) for r in ranges]
+        snapshot = store.snapshot()
+
+        events = [e for e in store.get_events()
+            if not isinstance(e, RecurringEvent)]
+        for event in rand.sample(events, 50):
+            delta = datetime.timedelta(days=rand.randrange(-3, 4))
+            store.update_event(event, start=event.start + delta,
+                end=event.end and event.end + delta)
+        store.remove_events(rand.sample(events, 50))
+        store.add_events(list(generate_events(50, seed=1)))
+        self.assertEqual([keys(snapshot.get_events(*r)) for r in ranges],
+            expected)
+        self.assertEqual(
+            [keys(store.snapshot().get_events(*r)) for r in ranges],
+            [keys(store.get_events(*r)) for r in ranges])
+
+    def test_find_conflicts(self):
+        "Test find_conflicts groups the events overlapping each other"
+        rand = random.Random(0)
+        events = list(generate_events(self.size, per_day=20))
+        for event in events:
+            event.resource = rand.randrange(10)
+        store = self.create_store()
+        store.add_events(events)
+        store.add(RecurringEvent('Daily', START + 9 * HOUR,
+                START + 10 * HOUR, freq='daily', count=60))
+        start, end = START + datetime.timedelta(days=3), START + 10 * DAY
+
+        by_resource = collections.defaultdict(list)
+        for event in store.get_events(start, end):
+            by_resource[getattr(event, 'resource', None)].append(event)
+        expected = {}
+        for resource, events in by_resource.items():
+            # Merge the groups of each pair of overlapping events
+            groups = []
+            for event in events:
+                event_start, event_end = util.event_keys(event)
+                if event_start >= event_end:
+                    continue
+                group = [event]
+                for other in groups[:]:
+                    if any(event_start < other_end and other_start < event_end
+                            for other_start, other_end in map(
+                                util.event_keys, other)):
+                        group.extend(other)
+                        groups.remove(other)
+                groups.append(group)
+            groups = sorted(keys(g) for g in groups if len(g) > 1)
+            if groups:
+                expected[resource] = groups
+
+        conflicts = store.find_conflicts(start, end, key='resource')
+        self.assertEqual(
+            {r: sorted(map(keys, g)) for r, g in conflicts.items()},
+            expected)
+        for groups in conflicts.values():
+            for group in groups:
+                self.assertEqual([util.event_keys(e) for e in group],
+                    sorted(util.event_keys(e) for e in group))
+
+    def test_find_free_slots(self):
+        "Test find_free_slots yields the slots without overlapping event"
+        rand = random.Random(0)
+        events = list(generate_events(200, per_day=8))
+        for event in events:
+            event.editable = rand.random() < 0.7
+        store = self.create_store()
+        store.add_events(events)
+        store.add(RecurringEvent('Lunch', START + 12 * HOUR,
+                START + 13 * HOUR, freq='daily', count=60))
+
+        for _ in range(10):
+            start = START + datetime.timedelta(
+                days=rand.randrange(20), minutes=rand.randrange(24 * 60))
+            end = start + datetime.timedelta(days=rand.choice([1, 3, 10]))
+            duration = datetime.timedelta(minutes=rand.choice([15, 60, 240]))
+            granularity = rand.choice([15, 30, 60])
+            hours = rand.choice([None, (datetime.time(9), datetime.time(17))])
+            # The occurrences of the recurring events are not editable
+            where = rand.choice([None, {'editable': False}])
+            busy = [util.event_keys(e)
+                for e in store.get_events(start - DAY, end + DAY)
+                if where is None or not e.editable]
+
+            expected = []
+            slot = datetime.datetime.combine(start.date(), datetime.time())
+            while slot + duration <= end:
+                slot_end = slot + duration
+                slot_start_key, slot_end_key = util.range_keys(
+                    slot, slot_end)
+                if (slot >= start
+                        and (not hours or (
+                                slot.time() >= hours[0]
+                                and slot_end <= datetime.datetime.combine(
+                                    slot.date(), hours[1])))
+                        and not any(event_start < slot_end_key
+                            and slot_start_key < event_end
+                            for event_start, event_end in busy
+                            if event_start < event_end)):
+                    expected.append((slot, slot_end))
+                slot += datetime.timedelta(minutes=granularity)
+
+            self.assertEqual(list(store.find_free_slots(start, end, duration,
+                        granularity, hours, where)), expected)
+
+    def test_aggregate(self):
+        "Test aggregate counts the events of each day, week and month"
+        rand = random.Random(0)
+        store = self.create_store()
+        store.add_events(list(generate_events(300, per_day=10)))
+        store.add(RecurringEvent('Night', START + 23 * HOUR,
+                START + 25 * HOUR, freq='daily', interval=3, count=20))
+
+        def aggregate(start, end, by):
+            first, last = start.toordinal(), end.toordinal()
+            events = [util.event_keys(e) for e in store.get_events(
+                    start - 4 * DAY, end + 4 * DAY)]
+            buckets = []
+            for day in range(first, last + 1):
+                date = datetime.date.fromordinal(day)
+                if by == 'day':
+                    bucket = date
+                elif by == 'week':
+                    bucket = date - datetime.timedelta(days=date.weekday())
+                else:
+                    bucket = date.replace(day=1)
+                if buckets and buckets[-1][0] == bucket:
+                    buckets[-1][2] = day
+                else:
+                    buckets.append([bucket, day, day])
+            result = []
+            for _, bucket_first, bucket_last in buckets:
+                count = duration = 0
+                for event_start, event_end in events:
+                    event_end = max(event_start, event_end)
+                    event_first = event_start // util.DAY_KEY
+                    event_last = (max(event_end - 1, event_start)
+                        // util.DAY_KEY)
+                    if (event_first <= bucket_last
+                            and event_last >= bucket_first):
+                        count += 1
+                    duration += max(0,
+                        min(event_end, (bucket_last + 1) * util.DAY_KEY)
+                        - max(event_start, bucket_first * util.DAY_KEY))
+                result.append((datetime.date.fromordinal(bucket_first),
+                        count, duration * 1440 // util.DAY_KEY))
+            return result
+
+        for i in range(10):
+            start = START + datetime.timedelta(
+                days=rand.randrange(-5, 30), hours=rand.randrange(24))
+            end = start + datetime.timedelta(days=rand.randrange(0, 60))
+            for by in ['day', 'week', 'month']:
+                self.assertEqual(store.aggregate(start, end, by),
+                    aggregate(start, end, by))
+            # The changes update the days already indexed
+            events = [e for e in store.get_events()
+                if not isinstance(e, RecurringEvent)]
+            for event in rand.sample(events, 10):
+                delta = datetime.timedelta(hours=rand.randrange(-50, 50))
+                store.update_event(event, start=event.start + delta,
+                    end=event.end and event.end + delta + datetime.timedelta(
+                        hours=rand.randrange(30)))
+            store.remove_events(rand.sample(events, 5))
+            store.add_events(list(generate_events(10, per_day=5, seed=i)))
+
+    def test_aware_datetimes(self):
+        "Test the events with aware datetimes are ordered by their instant"
+        paris = datetime.timezone(datetime.timedelta(hours=1))
+        start = datetime.datetime(2000, 1, 1, 10, tzinfo=paris)
+        events = [
+            Event('Paris', start, start + HOUR),
+            Event('UTC', start.replace(tzinfo=datetime.timezone.utc),
+                start.replace(tzinfo=datetime.timezone.utc) + HOUR),
+            ]
+        store = self.create_store()
+        store.add_events(events)
+        utc_start = datetime.datetime(
+            2000, 1, 1, 9, 30, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            [e.caption for e in store.get_events(utc_start, utc_start)],
+            ['Paris'])
+        self.assertEqual(
+            [e.caption for e in store.iter_events(start, start + 2 * HOUR)],
+            ['Paris', 'UTC'])
+        self.assertEqual(sorted(e.start for e in store.get_events()),
+            [e.start for e in events])
+
+    def test_update_removed_event(self):
+        "Test update_event refuses an event removed from the store"
+        store = self.create_store()
+        event = Event('Removed', START, START + HOUR)
+        store.add(event)
+        store.remove(event)
+        version = store.version
+
+        with self.assertRaises(ValueError):
+            store.update_event(event, start=START + 2 * HOUR)
+        self.assertEqual(store.version, version)
+        self.assertEqual(store.get_events(), [])
+
+    def test_update_cleared_event(self):
+        "Test update_event does not change the event reusing the id"
+        store = self.create_store()
+        stale = Event('Stale', START, START + HOUR)
+        store.add(stale)
+        store.clear()
+        event = Event('New', START, START + HOUR)
+        store.add(event)
+
+        with self.assertRaises(ValueError):
+            store.update_event(stale, start=START + 5 * HOUR,
+                end=START + 6 * HOUR)
+        self.assertEqual(store.get_events(START, START + HOUR), [event])
+        self.assertEqual(store.get_events(START + 5 * HOUR, START + 6 * HOUR),
+            [])
+
+    def test_contains(self):
+        "Test an event is in the store until it is removed"
+        store = self.create_store()
+        event = Event('Event', START)
+        self.assertNotIn(event, store)
+        store.add(event)
+        self.assertIn(event, store)
+        store.remove(event)
+        self.assertNotIn(event, store)
+
+
+class RecurringEventTestCase(unittest.TestCase):
+    "Test RecurringEvent"
+
+    def test_date_weekly(self):
+        "Test the occurrences of a weekly event starting at a date"
+        store = EventStore()
+        store.add(RecurringEvent('Weekly', datetime.date(2024, 3, 4),
+                until=datetime.date(2024, 4, 1),
+                exceptions=[datetime.date(2024, 3, 11)], all_day=True))
+        events = store.get_events(
+            datetime.datetime(2024, 3, 1), datetime.datetime(2024, 5, 1))
+        self.assertEqual(sorted(e.start for e in events), [
+                datetime.date(2024, 3, 4),
+                datetime.date(2024, 3, 18),
+                datetime.date(2024, 3, 25),
+                datetime.date(2024, 4, 1),
+                ])
+
+    def test_date_monthly(self):
+        "Test the occurrences of a monthly event of two dates"
+        store = EventStore()
+        store.add(RecurringEvent('Monthly', datetime.date(2024, 1, 31),
+                datetime.date(2024, 2, 1), freq='monthly', count=3,
+                all_day=True))
+        events = store.get_events(
+            datetime.datetime(2024, 3, 1), datetime.datetime(2024, 6, 1))
+        self.assertEqual(sorted((e.start, e.end) for e in events), [
+                (datetime.date(2024, 3, 31), datetime.date(2024, 4, 1)),
+                (datetime.date(2024, 5, 31), datetime.date(2024, 6, 1)),
+                ])
+
+    def test_date_range(self):
+        "Test the occurrences of a daily event in a range of dates"
+        store = EventStore()
+        store.add(RecurringEvent('Daily', datetime.date(2024, 3, 4),
+                freq='daily', all_day=True))
+        events = store.get_events(
+            datetime.date(2024, 3, 10), datetime.date(2024, 3, 12))
+        self.assertEqual(sorted(e.start for e in events), [
+                datetime.date(2024, 3, 10),
+                datetime.date(2024, 3, 11),
+                datetime.date(2024, 3, 12),
+                ])
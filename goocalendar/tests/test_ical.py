@@ -0,0 +1,126 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import concurrent.futures
+import datetime
+import io
+import os
+import unittest
+import zoneinfo
+from unittest import mock
+
+from goocalendar import Event, EventStore, RecurringEvent
+
+try:
+    PARIS = zoneinfo.ZoneInfo('Europe/Paris')
+except zoneinfo.ZoneInfoNotFoundError:
+    PARIS = None
+
+START = datetime.datetime(2000, 1, 1)
+
+
+def calendar(*lines):
+    return io.StringIO('\r\n'.join(
+            ['BEGIN:VCALENDAR', 'BEGIN:VEVENT', 'UID:1', 'SUMMARY:Event']
+            + list(lines) + ['END:VEVENT', 'END:VCALENDAR', '']))
+
+
+def local(value, zone):
+    "Return the naive local datetime of the value in the zone"
+    return value.replace(tzinfo=zone).astimezone().replace(tzinfo=None)
+
+
+class ICalendarTestCase(unittest.TestCase):
+    "Test the iCalendar import and export"
+
+    def test_import_in_process(self):
+        "Test import_ics does not start processes by default"
+        store = EventStore()
+        with mock.patch.object(os, 'cpu_count', return_value=4), \
+                mock.patch.object(concurrent.futures, 'ProcessPoolExecutor',
+                    side_effect=AssertionError):
+            store.import_ics(calendar('DTSTART:20000101T100000'))
+        self.assertEqual([e.caption for e in store.get_events()], ['Event'])
+
+    @unittest.skipIf(PARIS is None, "Europe/Paris is unknown")
+    def test_import_tzid(self):
+        "Test the times with a TZID are converted into the local time"
+        store = EventStore()
+        store.import_ics(calendar(
+                'DTSTART;TZID=Europe/Paris:20000101T100000',
+                'DTEND;TZID=Europe/Paris:20000101T110000',
+                'RRULE:FREQ=DAILY;COUNT=3',
+                'EXDATE;TZID=Europe/Paris:20000102T100000'))
+        event, = store.get_events()
+        start = local(datetime.datetime(2000, 1, 1, 10), PARIS)
+        self.assertEqual((event.start, event.end),
+            (start, start + datetime.timedelta(hours=1)))
+        self.assertEqual(event.exceptions,
+            {start + datetime.timedelta(days=1)})
+
+    def test_import_unknown_tzid(self):
+        "Test the times with an unknown TZID are kept"
+        store = EventStore()
+        store.import_ics(calendar(
+                'DTSTART;TZID="Unknown Standard Time":20000101T100000'))
+        event, = store.get_events()
+        self.assertEqual(event.start, datetime.datetime(2000, 1, 1, 10))
+
+    def test_export_aware(self):
+        "Test the aware datetimes are exported in UTC"
+        paris = datetime.timezone(datetime.timedelta(hours=1))
+        store = EventStore()
+        store.add(Event('Event', datetime.datetime(2000, 1, 1, 10,
+                    tzinfo=paris), datetime.datetime(2000, 1, 1, 11,
+                    tzinfo=paris)))
+        output = io.StringIO()
+        store.export_ics(output)
+        self.assertIn('DTSTART:20000101T090000Z\r\n'
+            'DTEND:20000101T100000Z\r\n', output.getvalue())
+
+        output.seek(0)
+        imported = EventStore()
+        imported.import_ics(output)
+        event, = imported.get_events()
+        self.assertEqual(event.start,
+            local(datetime.datetime(2000, 1, 1, 9), datetime.timezone.utc))
+
+    def test_round_trip(self):
+        "Test the events are imported back as exported"
+        store = EventStore()
+        store.add_events([
+                Event('Event', START, START + datetime.timedelta(hours=1)),
+                RecurringEvent('Weekly', START, START + datetime.timedelta(
+                        hours=2), count=5,
+                    exceptions=[START + datetime.timedelta(weeks=1)]),
+                ])
+        output = io.StringIO()
+        store.export_ics(output)
+        output.seek(0)
+        imported = EventStore()
+        imported.import_ics(output)
+        end = START + datetime.timedelta(weeks=10)
+        self.assertEqual(
+            sorted((e.caption, e.start, e.end)
+                for e in imported.get_events(START, end)),
+            sorted((e.caption, e.start, e.end)
+                for e in store.get_events(START, end)))
+
+    def test_export_all_day_exceptions(self):
+        "Test the exceptions of the all day events are exported as dates"
+        store = EventStore()
+        store.add(RecurringEvent('Weekly', datetime.date(2000, 1, 3),
+                until=datetime.date(2000, 1, 31),
+                exceptions=[datetime.date(2000, 1, 10)], all_day=True))
+        output = io.StringIO()
+        store.export_ics(output)
+        self.assertIn('DTSTART;VALUE=DATE:20000103\r\n', output.getvalue())
+        self.assertIn(';UNTIL=20000131\r\n', output.getvalue())
+        self.assertIn('EXDATE;VALUE=DATE:20000110\r\n', output.getvalue())
+
+        output.seek(0)
+        imported = EventStore()
+        imported.import_ics(output)
+        self.assertEqual(
+            sorted(e.start.date() for e in imported.get_events(
+                    START, START + datetime.timedelta(weeks=10))),
+            [datetime.date(2000, 1, d) for d in [3, 17, 24, 31]])
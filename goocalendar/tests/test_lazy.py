@@ -0,0 +1,12 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+from goocalendar import LazyEventStore
+
+from . import test_event
+
+
+class LazyEventStoreTestCase(test_event.EventStoreTestCase):
+    "Test LazyEventStore"
+
+    def create_store(self):
+        return LazyEventStore(lambda start, end: [])
@@ -0,0 +1,67 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import random
+import threading
+import unittest
+
+from goocalendar import Event, EventQueue, EventStore, util
+from goocalendar.testing import generate_events
+
+START = datetime.datetime(2000, 1, 1)
+
+
+class EventQueueTestCase(unittest.TestCase):
+    "Test EventQueue"
+
+    def test_skip_failing_change(self):
+        "Test a failing change is skipped and the next ones are applied"
+        store = EventStore()
+        queue = EventQueue(store)
+        queue.apply_delta({1: None})
+        queue.add_events([Event('Event', START)])
+
+        with self.assertLogs('goocalendar._queue') as logs:
+            self.assertFalse(queue._drain())
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue._source)
+        self.assertEqual([e.caption for e in store.get_events()], ['Event'])
+
+    def test_drain_threads(self):
+        "Test the changes queued from threads equal the changes applied"
+        store, expected = EventStore(), EventStore()
+        queue = EventQueue(store, time_slice=0, chunk_size=16)
+
+        def changes(target, seed):
+            "Apply random changes of the seed on the events of the seed"
+            rand = random.Random(seed)
+            events = list(generate_events(200, seed=seed))
+            target.add_events(events[:100])
+            target.remove_events(rand.sample(events[:100], 20))
+            for i in range(10):
+                target.apply_delta({
+                        (seed, rand.randrange(5)): Event(
+                            'Delta %s' % i, events[i].start),
+                        }, [(seed, rand.randrange(5))])
+            target.add_events(events[100:])
+
+        threads = [threading.Thread(target=changes, args=(queue, seed))
+            for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(t.is_alive() for t in threads):
+            queue._drain()
+        for thread in threads:
+            thread.join()
+        while queue._drain():
+            pass
+        for seed in range(4):
+            changes(expected, seed)
+
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(
+            sorted((e.caption, util.event_keys(e))
+                for e in store.get_events()),
+            sorted((e.caption, util.event_keys(e))
+                for e in expected.get_events()))
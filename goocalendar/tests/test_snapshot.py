@@ -0,0 +1,56 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import os
+import tempfile
+
+from goocalendar import Event, EventStore
+
+from . import test_event
+
+
+class SnapshotEventStoreTestCase(test_event.EventStoreTestCase):
+    "Test SnapshotEventStore"
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.stores = []
+        self.addCleanup(self.close_stores)
+
+    def close_stores(self):
+        for store in self.stores:
+            store.close()
+
+    def open_snapshot(self, events):
+        path = os.path.join(
+            self.directory, 'events-%s.snapshot' % len(self.stores))
+        events.save_snapshot(path)
+        store = EventStore.open_snapshot(path)
+        self.stores.append(store)
+        return store
+
+    def create_store(self):
+        return self.open_snapshot(EventStore())
+
+    def reopen_store(self, store):
+        return self.open_snapshot(store)
+
+    def test_aware_datetimes(self):
+        "Test the aware datetimes are read in UTC"
+        super().test_aware_datetimes()
+        paris = datetime.timezone(datetime.timedelta(hours=1))
+        start = datetime.datetime(2000, 1, 1, 10, tzinfo=paris)
+        events = EventStore()
+        events.add_events([
+                Event('Aware', start, start + datetime.timedelta(hours=1)),
+                Event('Naive', start.replace(tzinfo=None)),
+                ])
+        store = self.open_snapshot(events)
+        aware, naive = sorted(store.get_events(), key=lambda e: e.caption)
+        self.assertEqual((aware.start, aware.end),
+            (start, start + datetime.timedelta(hours=1)))
+        self.assertEqual(aware.start.utcoffset(), datetime.timedelta())
+        self.assertEqual(naive.start, start.replace(tzinfo=None))
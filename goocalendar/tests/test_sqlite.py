@@ -0,0 +1,55 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import os
+import tempfile
+
+from goocalendar import Event, RecurringEvent, SQLiteEventStore
+
+from . import test_event
+
+START = datetime.datetime(2000, 1, 1)
+
+
+class SQLiteEventStoreTestCase(test_event.EventStoreTestCase):
+    "Test SQLiteEventStore"
+
+    def create_store(self):
+        return SQLiteEventStore()
+
+
+class SQLiteFileEventStoreTestCase(test_event.EventStoreTestCase):
+    "Test SQLiteEventStore in a file"
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'events.sqlite')
+        self.stores = []
+        self.addCleanup(self.close_stores)
+
+    def close_stores(self):
+        for store in self.stores:
+            store._connection.close()
+
+    def create_store(self):
+        store = SQLiteEventStore(self.path)
+        self.stores.append(store)
+        return store
+
+    def reopen_store(self, store):
+        store.close()
+        return self.create_store()
+
+    def test_reopen_apply_delta(self):
+        "Test apply_delta finds the external ids after reopening"
+        store = self.create_store()
+        store.apply_delta({
+                1: Event('One', START),
+                'two': Event('Two', START),
+                3: RecurringEvent('Weekly', START),
+                })
+        store = self.reopen_store(store)
+        store.apply_delta({1: Event('Uno', START)}, ['two', 3])
+        self.assertEqual([e.caption for e in store.get_events()], ['Uno'])
@@ -0,0 +1,21 @@
+# This file is part of GooCalendar.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime
+import unittest
+
+from goocalendar import util
+
+
+class UtilTestCase(unittest.TestCase):
+    "Test util"
+
+    def test_datetime_key_aware(self):
+        "Test datetime_key takes the aware datetimes in UTC"
+        paris = datetime.timezone(datetime.timedelta(hours=1))
+        self.assertEqual(
+            util.datetime_key(datetime.datetime(2000, 1, 1, 0, tzinfo=paris)),
+            util.datetime_key(datetime.datetime(1999, 12, 31, 23)))
+        self.assertEqual(
+            util.datetime_key(datetime.datetime(
+                    2000, 1, 1, tzinfo=datetime.timezone.utc)),
+            util.datetime_key(datetime.date(2000, 1, 1)))
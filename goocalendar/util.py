@@ -1,8 +1,12 @@
 # This file is part of GooCalendar.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import datetime
+import re
 import sys
 
+# The datetime_key of a day
+DAY_KEY = 86400 * 1000000
+
 
 def my_weekdatescalendar(cal, date):
     weeks = cal.monthdatescalendar(date.year, date.month)
@@ -60,6 +64,21 @@ def next_month(cal, date):
     return datetime.datetime(year, month, day)
 
 
+def add_months(value, months):
+    """
+    Given a date or a datetime, return it moved by a number of months or None
+    if its day does not exist in the resulting month.
+    """
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    if not datetime.MINYEAR <= year <= datetime.MAXYEAR:
+        raise OverflowError('year %d is out of range' % year)
+    try:
+        return value.replace(year=year, month=month % 12 + 1)
+    except ValueError:
+        return None
+
+
 def same_month(date1, date2):
     return (date1.year == date2.year and date1.month == date2.month)
 
@@ -88,31 +107,121 @@ def time_delta(datetime1, datetime2):
 
 
 def event_days(event):
-    end = event.end if event.end else event.start
-    return time_delta(event.start, end).days
+    start, end = event_keys(event)
+    return abs(end - start) // DAY_KEY
 
 
 def event_intersects(event, start, end=None):
+    return interval_intersects(event.start, event.end, start, end)
+
+
+def interval_intersects(event_start, event_end, start, end=None):
     end = end if end else start
-    event_end = event.end if event.end else event.start
-    return ((event.start >= start and event.start < end)
+    event_end = event_end if event_end else event_start
+    return ((event_start >= start and event_start < end)
+        or (event_end > start and event_end <= end)
+        or (event_start < start and event_end > end)
+        or (event_start == start and event_end == end))
+
+
+def keys_intersect(event_start, event_end, start, end):
+    """
+    Given the datetime_key of the start and the end of an event and of a
+    range, return if they intersect like interval_intersects.
+    """
+    return ((event_start >= start and event_start < end)
         or (event_end > start and event_end <= end)
-        or (event.start < start and event_end > end)
-        or (event.start == start and event_end == end))
+        or (event_start < start and event_end > end)
+        or (event_start == start and event_end == end))
+
+
+def datetime_key(value):
+    """
+    Given a date or a datetime, return the integer number of microseconds
+    since the proleptic Gregorian origin. Dates are taken at midnight and
+    aware datetimes in UTC.
+    """
+    if isinstance(value, datetime.datetime):
+        offset = value.utcoffset()
+        if offset is not None:
+            value = value.replace(tzinfo=None) - offset
+    key = value.toordinal() * 86400
+    if isinstance(value, datetime.datetime):
+        key += value.hour * 3600 + value.minute * 60 + value.second
+        return key * 1000000 + value.microsecond
+    return key * 1000000
+
+
+# Greater than the datetime_key of any datetime
+MAX_KEY = datetime_key(datetime.datetime.max) + 1
+
+
+def key_datetime(key):
+    "Given a datetime_key, return its datetime."
+    days, microseconds = divmod(key, DAY_KEY)
+    return (datetime.datetime.fromordinal(days)
+        + datetime.timedelta(microseconds=microseconds))
+
+
+def event_keys(event):
+    """
+    Given an event, return its start and end as a pair of datetime_key.
+    The keys are cached on the event until its start or end changes.
+    """
+    keys = event._keys
+    if keys is None:
+        start = datetime_key(event.start)
+        end = datetime_key(event.end) if event.end else start
+        keys = event._keys = (start, end)
+    return keys
+
+
+def range_keys(start, end=None):
+    """
+    Given the start and the end of a range, return them as a pair of
+    datetime_key. A missing end is the start.
+    """
+    start_key = datetime_key(start)
+    return start_key, datetime_key(end) if end else start_key
+
+
+def bound_keys(start=None, end=None):
+    """
+    Given an optional start and end, return them as a pair of datetime_key
+    where the missing bounds include all the keys.
+    """
+    return (datetime_key(start) if start else -1,
+        datetime_key(end) if end else MAX_KEY)
+
+
+def tokenize(text):
+    "Return the list of the lower case words of the text"
+    return re.findall(r'\w+', text.lower())
+
+
+def match_tokens(text, tokens):
+    """
+    Given a text and a list of tokens, return if each token starts a word of
+    the text.
+    """
+    words = tokenize(text)
+    return all(any(w.startswith(t) for w in words) for t in tokens)
 
 
 def get_intersection_list(list, start, end):
+    start, end = range_keys(start, end)
     intersections = []
     for event in list:
-        if event_intersects(event, start, end):
+        if keys_intersect(*event_keys(event), start, end):
             intersections.append(event)
     return intersections
 
 
 def count_intersections(list, start, end):
+    start, end = range_keys(start, end)
     intersections = 0
     for event in list:
-        if event_intersects(event, start, end):
+        if keys_intersect(*event_keys(event), start, end):
             intersections += 1
     return intersections
 
@@ -122,23 +231,54 @@ def count_parallel_events(list, start, end):
     Given a list of events, this function returns the maximum number of
     parallel events in the given timeframe.
     """
+    return count_parallel_keys(
+        [event_keys(e) for e in list], *range_keys(start, end))
+
+
+def count_parallel_keys(keys, start, end):
+    """
+    Given a list of pairs of datetime_key, this function returns the maximum
+    number of parallel intervals between the start and end keys.
+    """
     parallel = 0
-    i = 0
-    for i, event1 in enumerate(list):
-        if not event_intersects(event1, start, end):
+    for i, (start1, end1) in enumerate(keys):
+        if not keys_intersect(start1, end1, start, end):
             continue
         parallel = max(parallel, 1)
-        for f in range(i + 1, len(list)):
-            event2 = list[f]
-            new_start = max(event1.start, event2.start)
-            new_end = min(event1.end, event2.end)
-            if (event_intersects(event2, start, end)
-                    and event_intersects(event2, new_start, new_end)):
-                n = count_parallel_events(list[f:], new_start, new_end)
+        for f in range(i + 1, len(keys)):
+            start2, end2 = keys[f]
+            new_start = max(start1, start2)
+            new_end = min(end1, end2)
+            if (keys_intersect(start2, end2, start, end)
+                    and keys_intersect(start2, end2, new_start, new_end)):
+                n = count_parallel_keys(keys[f:], new_start, new_end)
                 parallel = max(parallel, n + 1)
     return parallel
 
 
+def overlapping_groups(events):
+    """
+    Given a list of events, return the lists of at least two events which
+    overlap directly or through other events of the list, sorted by start.
+    The events without duration overlap nothing.
+    """
+    groups, group, group_end = [], [], None
+    for (start, end), event in sorted(
+            ((event_keys(e), e) for e in events), key=lambda k: k[0]):
+        if end <= start:
+            continue
+        if group and start < group_end:
+            group.append(event)
+            group_end = max(group_end, end)
+        else:
+            if len(group) > 1:
+                groups.append(group)
+            group, group_end = [event], end
+    if len(group) > 1:
+        groups.append(group)
+    return groups
+
+
 def next_level(cur_time, min_per_level):
     """
     Given a datetime and the duration (in minutes) of time levels,